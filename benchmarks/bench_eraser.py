@@ -0,0 +1,165 @@
+"""
+Benchmarks Eraser.run against a local fake Telegram backend, without network access
+or a real account. Reports throughput, request counts, peak memory and the time
+to the first delete request, so optimisations can be compared between commits.
+Run it from the repository root with `python -m benchmarks.bench_eraser`.
+
+Usage:
+    bench_eraser [options]
+
+Options:
+    --kind KIND             Dialog type: supergroup, chat or user. [default: supergroup]
+    --dialogs NUM           Number of dialogs. [default: 10]
+    --messages NUM          Messages per dialog. [default: 100000]
+    --own-every NUM         Every NUM-th message of a dialog is own. [default: 2]
+    --latency MS            Latency of every request in milliseconds. [default: 0]
+    --flood-rate NUM        Requests of one type per second that trigger a FloodWait
+                            (0 to never raise one). [default: 0]
+    --flood-seconds NUM     Duration of injected FloodWaits in seconds. [default: 1]
+    --rate NUM              Initial rate of every request class of the rate limiter,
+                            in requests per second. [default: 1000]
+    --service-every NUM     Every NUM-th own message is a service message, which can't
+                            be deleted without admin rights (0 for none). [default: 0]
+    --flaky-every NUM       Every NUM-th own message is skipped by the first request
+                            deleting it (0 for none). [default: 0]
+    --admin                 Make us the creator of supergroups (admin fast path).
+    --concurrency NUM       Number of dialogs processed at the same time. [default: 1]
+    --scan-workers NUM      Number of ID ranges of a dialog scanned at the same time.
+                            [default: 1]
+    -m --media-type TYPES   Delete only specific media types (see tgeraser --help).
+    --global-search         Find own messages with global search (needs -m).
+    --takeout               Scan through a takeout session.
+    --takeout-delay SECS    Make the takeout wait for approval this long, so the
+                            scans fall back to the normal session. [default: 0]
+    --archive               Archive messages and download their media before deleting.
+    --archive-workers NUM   Number of media downloaded at the same time. [default: 4]
+    --session-backend NAME  Session storage: file, memory or string. [default: file]
+    --json PATH             Also write the results as JSON to the file.
+    -h --help               Show this screen.
+
+"""
+
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Any
+
+from docopt import docopt
+
+from tgeraser.ratelimit import RateLimiter
+from tgeraser.utils import cast_to_int
+
+from .fake_telegram import FakeEraser, FakeTelegram
+
+ENTITY_TYPES = {"supergroup": "chat", "chat": "chat", "user": "user"}
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of the process in bytes
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+async def run_benchmark(backend: FakeTelegram, **kwargs: Any) -> dict[str, Any]:
+    """
+    Runs the Eraser against the backend and returns the measurements
+    """
+    client = FakeEraser(backend, **kwargs)
+    rss_before = peak_rss()
+    try:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            start = time.monotonic()
+            summary = await client.run()
+            duration = time.monotonic() - start
+    finally:
+        await client.disconnect()
+
+    first_delete = backend.first_delete_at
+    return {
+        "messages": backend.total_messages,
+        "found": summary["found"],
+        "requested": summary["requested"],
+        "deleted": backend.deleted,
+        "undeletable": summary["undeletable"],
+        "duration": round(duration, 3),
+        "messages_per_second": round(backend.deleted / duration, 1) if duration else 0,
+        "rpc_count": sum(backend.rpc_counts.values()),
+        "rpc_counts": dict(backend.rpc_counts.most_common()),
+        "flood_waits": backend.flood_waits,
+        "peak_rss_mb": round(peak_rss() / 2**20, 1),
+        "rss_growth_mb": round((peak_rss() - rss_before) / 2**20, 1),
+        "time_to_first_delete": (
+            None if first_delete is None else round(first_delete - start, 3)
+        ),
+    }
+
+
+def main() -> None:
+    """
+    Entry point of the benchmark
+    """
+    arguments = docopt(__doc__)
+    kind = arguments["--kind"]
+    if kind not in ENTITY_TYPES:
+        sys.exit(f"Unknown dialog type: {kind!r}")
+
+    backend = FakeTelegram(
+        kind=kind,
+        dialogs=cast_to_int(arguments["--dialogs"], "dialogs"),
+        messages_per_dialog=cast_to_int(arguments["--messages"], "messages"),
+        own_every=cast_to_int(arguments["--own-every"], "own-every"),
+        latency=cast_to_int(arguments["--latency"], "latency") / 1000,
+        flood_rate=cast_to_int(arguments["--flood-rate"], "flood-rate"),
+        flood_seconds=cast_to_int(arguments["--flood-seconds"], "flood-seconds"),
+        admin=arguments["--admin"],
+        takeout_delay=cast_to_int(arguments["--takeout-delay"], "takeout-delay"),
+        service_every=cast_to_int(arguments["--service-every"], "service-every"),
+        flaky_every=cast_to_int(arguments["--flaky-every"], "flaky-every"),
+    )
+    rate = float(cast_to_int(arguments["--rate"], "rate"))
+    RateLimiter.DEFAULT_RATES = dict.fromkeys(RateLimiter.DEFAULT_RATES, rate)
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, "archive") if arguments["--archive"] else None
+        results = asyncio.run(
+            run_benchmark(
+                backend,
+                session_name=os.path.join(directory, "bench"),
+                api_id=1,
+                api_hash="0" * 32,
+                proxy=None,
+                limit=None,
+                peers=None,
+                wipe_everything=True,
+                entity_type=ENTITY_TYPES[kind],
+                older_than=None,
+                media_types=arguments["--media-type"],
+                global_search=arguments["--global-search"],
+                takeout=arguments["--takeout"],
+                archive=archive,
+                archive_workers=cast_to_int(
+                    arguments["--archive-workers"], "archive-workers"
+                ),
+                session_backend=arguments["--session-backend"],
+                concurrency=cast_to_int(arguments["--concurrency"], "concurrency"),
+                scan_workers=cast_to_int(arguments["--scan-workers"], "scan-workers"),
+                interactive=False,
+            )
+        )
+
+    for key, value in results.items():
+        print(f"{key}: {value}")
+    if arguments["--json"]:
+        with open(arguments["--json"], "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmarks the startup of the CLI with `python -X importtime`: the help, version
+and planning paths. Planning can't run without an account, so its path is measured
+as the imports it needs: the CLI and the Eraser with Telethon.
+Run it from the repository root with `python -m benchmarks.bench_startup`.
+
+Usage:
+    bench_startup [options]
+
+Options:
+    --repeat NUM    Runs per path, the median is reported. [default: 5]
+    --top NUM       Number of the slowest imports shown per path. [default: 5]
+    --json PATH     Also write the results as JSON to the file.
+    -h --help       Show this screen.
+
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, List
+
+from docopt import docopt
+
+from tgeraser.utils import cast_to_int
+
+PATHS = {
+    "help": ["-m", "tgeraser", "--help"],
+    "version": ["-m", "tgeraser", "--version"],
+    "plan": ["-c", "import tgeraser.core, tgeraser.eraser"],
+}
+
+
+def parse_importtime(output: str) -> dict[str, int]:
+    """
+    Returns the cumulative import time in microseconds of every top-level import
+    """
+    imports = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented by two spaces per level
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def measure(args: List[str]) -> dict[str, Any]:
+    """
+    Runs the interpreter once and returns wall time, import time and imports
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    wall = time.perf_counter() - start
+    imports = parse_importtime(process.stderr)
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": sum(imports.values()) / 1000,
+        "modules": process.stderr.count("import time:") - 1,
+        "telethon": "telethon" in process.stderr,
+        "imports": imports,
+    }
+
+
+def run_path(args: List[str], repeat: int, top: int) -> dict[str, Any]:
+    """
+    Measures a path `repeat` times and returns the medians
+    """
+    runs = [measure(args) for _ in range(repeat)]
+    slowest = sorted(runs[-1]["imports"].items(), key=lambda item: -item[1])[:top]
+    return {
+        "wall_ms": round(statistics.median(r["wall_ms"] for r in runs), 1),
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "modules": runs[-1]["modules"],
+        "telethon": runs[-1]["telethon"],
+        "slowest": {name: round(us / 1000, 1) for name, us in slowest},
+    }
+
+
+def main() -> None:
+    """
+    Entry point of the benchmark
+    """
+    arguments = docopt(__doc__)
+    repeat = cast_to_int(arguments["--repeat"], "repeat")
+    top = cast_to_int(arguments["--top"], "top")
+
+    results = {name: run_path(args, repeat, top) for name, args in PATHS.items()}
+    for name, result in results.items():
+        print(
+            f"{name}: {result['wall_ms']} ms wall, {result['import_ms']} ms imports, "
+            f"{result['modules']} modules, telethon imported: {result['telethon']}"
+        )
+        for module, ms in result["slowest"].items():
+            print(f"    {ms:8.1f} ms  {module}")
+    if arguments["--json"]:
+        with open(arguments["--json"], "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,738 @@
+"""
+Local stand-in for the Telegram requests sent by the Eraser
+"""
+
+import asyncio
+import bisect
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, List
+
+from telethon import utils
+from telethon.errors import (
+    ChatAdminRequiredError,
+    FloodWaitError,
+    PeerIdInvalidError,
+    SearchQueryEmptyError,
+    TakeoutInitDelayError,
+    UsernameNotOccupiedError,
+)
+from telethon.tl.functions import (
+    InvokeWithTakeoutRequest,
+    account,
+    channels,
+    messages,
+    upload,
+)
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types import (
+    Channel,
+    Chat,
+    ChatPhotoEmpty,
+    Dialog,
+    Document,
+    DocumentAttributeFilename,
+    DocumentAttributeVideo,
+    InputMessagesFilterDocument,
+    InputMessagesFilterEmpty,
+    InputMessagesFilterPhotos,
+    InputMessagesFilterVideo,
+    InputUserSelf,
+    Message,
+    MessageActionChatEditTitle,
+    MessageEmpty,
+    MessageMediaDocument,
+    MessageMediaPhoto,
+    MessageMediaWebPage,
+    MessageService,
+    PeerChat,
+    PeerNotifySettings,
+    PeerUser,
+    Photo,
+    PhotoSize,
+    User,
+    WebPage,
+)
+from telethon.tl.types import account as account_types
+from telethon.tl.types import contacts
+from telethon.tl.types import messages as messages_types
+from telethon.tl.types import storage
+from telethon.tl.types import upload as upload_types
+
+from tgeraser.eraser import Eraser
+
+SELF_ID = 1000
+OTHER_ID = 1001
+MESSAGE_INTERVAL = 60  # seconds between two messages of a dialog
+
+KINDS = ("supergroup", "chat", "user")
+# A "webpage" is a text message with a link preview, which isn't media of any type
+MEDIA_CYCLE = (
+    "photo",
+    "video",
+    "document",
+    "webpage",
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+)
+FILTER_KINDS: dict[type, frozenset[str | None] | None] = {
+    InputMessagesFilterEmpty: None,
+    InputMessagesFilterPhotos: frozenset({"photo"}),
+    InputMessagesFilterVideo: frozenset({"video"}),
+    InputMessagesFilterDocument: frozenset({"document"}),
+}
+
+_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+MEDIA = {
+    "photo": MessageMediaPhoto(
+        photo=Photo(
+            id=1,
+            access_hash=1,
+            file_reference=b"",
+            date=_DATE,
+            sizes=[PhotoSize(type="x", w=800, h=600, size=65536)],
+            dc_id=2,
+        )
+    ),
+    "video": MessageMediaDocument(
+        document=Document(
+            id=2,
+            access_hash=2,
+            file_reference=b"",
+            date=_DATE,
+            mime_type="video/mp4",
+            size=1048576,
+            dc_id=2,
+            attributes=[DocumentAttributeVideo(duration=10, w=640, h=480)],
+        )
+    ),
+    "document": MessageMediaDocument(
+        document=Document(
+            id=3,
+            access_hash=3,
+            file_reference=b"",
+            date=_DATE,
+            mime_type="application/pdf",
+            size=131072,
+            dc_id=2,
+            attributes=[DocumentAttributeFilename(file_name="file.pdf")],
+        )
+    ),
+    "webpage": MessageMediaWebPage(
+        webpage=WebPage(
+            id=4,
+            url="https://example.com",
+            display_url="example.com",
+            hash=0,
+            photo=Photo(
+                id=4,
+                access_hash=4,
+                file_reference=b"",
+                date=_DATE,
+                sizes=[PhotoSize(type="x", w=800, h=600, size=65536)],
+                dc_id=2,
+            ),
+        )
+    ),
+}
+
+# Sizes of the files of MEDIA by photo or document ID
+FILE_SIZES = {1: 65536, 2: 1048576, 3: 131072}
+
+
+class FakeDialog:
+    """
+    Synthetic dialog whose messages are derived from their position,
+    so only the deleted ones take memory (one bit per message).
+    Every `service_every`-th own message is a service message, which only
+    an admin may delete outside private chats, and every `flaky_every`-th
+    own message is skipped by the first request deleting it.
+    """
+
+    def __init__(
+        self,
+        entity: Any,
+        first_id: int,
+        size: int,
+        own_every: int,
+        end: datetime,
+        service_every: int = 0,
+        flaky_every: int = 0,
+    ) -> None:
+        self.entity = entity
+        self.peer = utils.get_peer(entity)
+        self.first_id = first_id
+        self.size = size
+        self.own_every = own_every
+        self.service_every = service_every
+        self.flaky_every = flaky_every
+        self.start = end - timedelta(seconds=size * MESSAGE_INTERVAL)
+        self.live = size
+        self.__deleted = bytearray(size // 8 + 1)
+        self.__skipped: set[int] = set()
+
+    def is_own(self, index: int) -> bool:
+        """
+        Tells whether the message at the index was sent by us
+        """
+        return index % self.own_every == 0
+
+    def is_service(self, index: int) -> bool:
+        """
+        Tells whether the message at the index is an own service message
+        """
+        return bool(
+            self.service_every
+            and self.is_own(index)
+            and (index // self.own_every) % self.service_every == self.service_every - 1
+        )
+
+    def skips(self, index: int) -> bool:
+        """
+        Tells whether a delete request silently skips the message at the index
+        """
+        if self.is_service(index):
+            return not (isinstance(self.entity, User) or self.entity.creator)
+        if not self.flaky_every or (index // self.own_every) % self.flaky_every:
+            return False
+        if index in self.__skipped:
+            return False
+        self.__skipped.add(index)
+        return True
+
+    def media_kind(self, index: int) -> str | None:
+        """
+        Returns the media type of the message at the index
+        """
+        if self.is_service(index):
+            return None
+        return MEDIA_CYCLE[(index // self.own_every) % len(MEDIA_CYCLE)]
+
+    def is_deleted(self, index: int) -> bool:
+        """
+        Tells whether the message at the index was deleted
+        """
+        return bool(self.__deleted[index >> 3] & (1 << (index & 7)))
+
+    def delete(self, index: int) -> bool:
+        """
+        Deletes the message at the index, returns whether it existed
+        """
+        if not 0 <= index < self.size or self.is_deleted(index):
+            return False
+        self.__deleted[index >> 3] |= 1 << (index & 7)
+        self.live -= 1
+        return True
+
+    def date_index(self, date: datetime) -> int:
+        """
+        Returns the index of the last message sent before the date
+        """
+        seconds = (date - self.start).total_seconds()
+        return min(self.size, -int(-seconds // MESSAGE_INTERVAL)) - 1
+
+    def message(self, index: int) -> Any:
+        """
+        Builds the message at the index
+        """
+        if self.is_deleted(index):
+            return MessageEmpty(id=self.first_id + index, peer_id=self.peer)
+        own = self.is_own(index)
+        if own:
+            from_id = PeerUser(SELF_ID)
+        elif isinstance(self.peer, PeerUser):
+            from_id = None
+        else:
+            from_id = PeerUser(OTHER_ID)
+        if self.is_service(index):
+            return MessageService(
+                id=self.first_id + index,
+                peer_id=self.peer,
+                date=self.start + timedelta(seconds=index * MESSAGE_INTERVAL),
+                action=MessageActionChatEditTitle(title="Bench"),
+                out=own,
+                from_id=from_id,
+            )
+        kind = self.media_kind(index)
+        return Message(
+            id=self.first_id + index,
+            peer_id=self.peer,
+            date=self.start + timedelta(seconds=index * MESSAGE_INTERVAL),
+            message=f"Message {index}" if kind in (None, "webpage") else "",
+            out=own,
+            from_id=from_id,
+            media=MEDIA[kind] if kind else None,
+        )
+
+    def select(
+        self,
+        top: int,
+        bottom: int,
+        own_only: bool,
+        kinds: frozenset[str | None] | None,
+        limit: int,
+    ) -> List[int]:
+        """
+        Returns up to `limit` indices of live messages in (bottom, top], newest first
+        """
+        step = 1
+        if own_only:
+            step = self.own_every
+            top -= top % step
+        found = []
+        for index in range(top, bottom, -step):
+            if len(found) >= limit:
+                break
+            if self.is_deleted(index):
+                continue
+            if kinds is not None and self.media_kind(index) not in kinds:
+                continue
+            found.append(index)
+        return found
+
+
+class FakeTelegram:
+    """
+    Answers the requests of the Eraser from synthetic dialogs of one kind
+    (supergroup, chat or user), optionally with latency and FloodWaits once
+    more than `flood_rate` requests of the same type are sent per second.
+    Requests of a takeout session may be sent TAKEOUT_FLOOD_FACTOR times
+    as fast. Counts requests and deleted messages.
+    """
+
+    PARTICIPANT_HISTORY_CHUNK = 10000
+    TAKEOUT_FLOOD_FACTOR = 10
+
+    def __init__(
+        self,
+        kind: str = "supergroup",
+        dialogs: int = 10,
+        messages_per_dialog: int = 100000,
+        own_every: int = 2,
+        latency: float = 0.0,
+        flood_rate: float = 0.0,
+        flood_seconds: int = 1,
+        admin: bool = False,
+        takeout_delay: int = 0,
+        service_every: int = 0,
+        flaky_every: int = 0,
+    ) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown dialog kind: {kind!r}")
+        self.latency = latency
+        self.takeout_delay = takeout_delay
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.me = User(
+            id=SELF_ID, is_self=True, access_hash=SELF_ID, first_name="Bench"
+        )
+        self.other = User(id=OTHER_ID, access_hash=OTHER_ID, first_name="Other")
+
+        now = datetime.now(timezone.utc)
+        self.dialogs: List[FakeDialog] = []
+        next_id = 1
+        for i in range(dialogs):
+            entity = self.__make_entity(kind, i, admin)
+            # Only channels have their own message IDs, other dialogs share them
+            first_id = 1 if isinstance(entity, Channel) else next_id
+            dialog = FakeDialog(
+                entity,
+                first_id,
+                messages_per_dialog,
+                own_every,
+                now,
+                service_every=service_every,
+                flaky_every=flaky_every,
+            )
+            self.dialogs.append(dialog)
+            if not isinstance(entity, Channel):
+                next_id += messages_per_dialog
+        self.__by_peer_id = {utils.get_peer_id(d.entity): d for d in self.dialogs}
+        self.__shared = sorted(
+            (d.first_id, n)
+            for n, d in enumerate(self.dialogs)
+            if not isinstance(d.entity, Channel)
+        )
+
+        self.rpc_counts: Counter[str] = Counter()
+        self.flood_waits = 0
+        self.deleted = 0
+        self.first_delete_at: float | None = None
+        self.__pts = 0
+        self.__windows: dict[type, deque[float]] = {}
+        self.__blocked_until: dict[type, float] = {}
+
+    @staticmethod
+    def __make_entity(kind: str, i: int, admin: bool) -> Any:
+        if kind == "supergroup":
+            return Channel(
+                id=2000 + i,
+                title=f"Supergroup {i}",
+                photo=ChatPhotoEmpty(),
+                date=_DATE,
+                creator=admin,
+                megagroup=True,
+                access_hash=2000 + i,
+                username=f"bench_supergroup_{i}",
+            )
+        if kind == "chat":
+            return Chat(
+                id=3000 + i,
+                title=f"Chat {i}",
+                photo=ChatPhotoEmpty(),
+                participants_count=2,
+                date=_DATE,
+                version=1,
+            )
+        return User(
+            id=4000 + i,
+            access_hash=4000 + i,
+            first_name=f"User {i}",
+            username=f"bench_user_{i}",
+        )
+
+    @property
+    def total_messages(self) -> int:
+        """
+        Number of own messages the backend started with
+        """
+        return sum(-(-d.size // d.own_every) for d in self.dialogs)
+
+    async def handle(self, request: Any) -> Any:
+        """
+        Answers a single resolved request
+        """
+        takeout = isinstance(request, InvokeWithTakeoutRequest)
+        if takeout:
+            request = request.query
+        self.rpc_counts[type(request).__name__ + (" (takeout)" if takeout else "")] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.__check_flood(request, takeout)
+        handler = self.HANDLERS.get(type(request))
+        if handler is None:
+            raise NotImplementedError(
+                f"The fake backend doesn't handle {type(request).__name__}"
+            )
+        return handler(self, request)
+
+    def __check_flood(self, request: Any, takeout: bool) -> None:
+        if not self.flood_rate:
+            return
+        now = time.monotonic()
+        key = (type(request), takeout)
+        limit = self.flood_rate * (self.TAKEOUT_FLOOD_FACTOR if takeout else 1)
+        if self.__blocked_until.get(key, 0) > now:
+            self.flood_waits += 1
+            wait = self.__blocked_until[key] - now
+            raise FloodWaitError(request=request, capture=max(1, round(wait)))
+        window = self.__windows.setdefault(key, deque())
+        window.append(now)
+        while window[0] <= now - 1:
+            window.popleft()
+        if len(window) > limit:
+            window.clear()
+            self.__blocked_until[key] = now + self.flood_seconds
+            self.flood_waits += 1
+            raise FloodWaitError(request=request, capture=self.flood_seconds)
+
+    def __dialog(self, peer: Any) -> FakeDialog:
+        dialog = self.__by_peer_id.get(utils.get_peer_id(peer))
+        if dialog is None:
+            raise PeerIdInvalidError(request=None)
+        return dialog
+
+    def __shared_dialog(self, message_id: int) -> FakeDialog | None:
+        pos = bisect.bisect_right(self.__shared, (message_id, len(self.dialogs)))
+        return self.dialogs[self.__shared[pos - 1][1]] if pos else None
+
+    def __result(
+        self, dialog: FakeDialog | None, items: List[Any], count: int
+    ) -> Any:
+        chats = [d.entity for d in self.dialogs if not isinstance(d.entity, User)]
+        users = [self.me, self.other]
+        users.extend(d.entity for d in self.dialogs if isinstance(d.entity, User))
+        if dialog is not None and isinstance(dialog.entity, Channel):
+            return messages_types.ChannelMessages(
+                pts=self.__pts,
+                count=count,
+                messages=items,
+                topics=[],
+                chats=chats,
+                users=users,
+            )
+        return messages_types.MessagesSlice(
+            count=count, messages=items, topics=[], chats=chats, users=users
+        )
+
+    @staticmethod
+    def __bounds(
+        dialog: FakeDialog, request: Any, max_date: datetime | None
+    ) -> tuple[int, int]:
+        top = dialog.size - 1
+        if request.offset_id:
+            top = min(top, request.offset_id - dialog.first_id - 1)
+        if request.max_id:
+            top = min(top, request.max_id - dialog.first_id - 1)
+        if max_date is not None:
+            top = min(top, dialog.date_index(max_date))
+        bottom = -1
+        if request.min_id:
+            bottom = max(bottom, request.min_id - dialog.first_id)
+        return top, bottom
+
+    def _search(self, request: messages.SearchRequest) -> Any:
+        dialog = self.__dialog(request.peer)
+        top, bottom = self.__bounds(dialog, request, request.max_date)
+        if request.min_date is not None:
+            bottom = max(bottom, dialog.date_index(request.min_date))
+        own_only = request.from_id is not None
+        kinds = FILTER_KINDS.get(type(request.filter), frozenset())
+        if not request.limit:
+            count = len(dialog.select(top, bottom, own_only, kinds, dialog.size))
+            return self.__result(dialog, [], count)
+        found = dialog.select(top, bottom, own_only, kinds, request.limit)
+        return self.__result(dialog, [dialog.message(i) for i in found], dialog.live)
+
+    def _get_history(self, request: messages.GetHistoryRequest) -> Any:
+        dialog = self.__dialog(request.peer)
+        top, bottom = self.__bounds(dialog, request, request.offset_date)
+        found = dialog.select(top, bottom, False, None, request.limit or 1)
+        return self.__result(dialog, [dialog.message(i) for i in found], dialog.live)
+
+    def _search_global(self, request: messages.SearchGlobalRequest) -> Any:
+        kinds = FILTER_KINDS.get(type(request.filter), frozenset())
+        if not request.q and kinds is None:
+            raise SearchQueryEmptyError(request=request)
+        start = 0
+        offset_id = 0
+        if request.offset_id:
+            start = self.dialogs.index(self.__dialog(request.offset_peer))
+            offset_id = request.offset_id
+        found: List[Any] = []
+        for dialog in self.dialogs[start:]:
+            if not self.__matches_global(dialog.entity, request):
+                continue
+            top = dialog.size - 1
+            if offset_id:
+                top = offset_id - dialog.first_id - 1
+                offset_id = 0
+            if request.max_date is not None:
+                top = min(top, dialog.date_index(request.max_date))
+            indices = dialog.select(top, -1, False, kinds, request.limit - len(found))
+            found.extend(dialog.message(i) for i in indices)
+            if len(found) >= request.limit:
+                break
+        return self.__result(None, found, len(found))
+
+    @staticmethod
+    def __matches_global(entity: Any, request: messages.SearchGlobalRequest) -> bool:
+        if request.users_only:
+            return isinstance(entity, User)
+        if request.groups_only:
+            return isinstance(entity, Chat) or getattr(entity, "megagroup", False)
+        if request.broadcasts_only:
+            return isinstance(entity, Channel) and not entity.megagroup
+        return True
+
+    def __affected(self, count: int) -> messages_types.AffectedMessages:
+        if self.first_delete_at is None:
+            self.first_delete_at = time.monotonic()
+        self.deleted += count
+        self.__pts += count
+        return messages_types.AffectedMessages(pts=self.__pts, pts_count=count)
+
+    def _delete_messages(self, request: messages.DeleteMessagesRequest) -> Any:
+        count = 0
+        for message_id in request.id:
+            dialog = self.__shared_dialog(message_id)
+            if dialog is None:
+                continue
+            index = message_id - dialog.first_id
+            # Both sides of a private conversation can be deleted
+            if isinstance(dialog.entity, User) or dialog.is_own(index):
+                if not dialog.skips(index):
+                    count += dialog.delete(index)
+        return self.__affected(count)
+
+    def _delete_channel_messages(self, request: channels.DeleteMessagesRequest) -> Any:
+        dialog = self.__dialog(request.channel)
+        count = 0
+        for message_id in request.id:
+            index = message_id - dialog.first_id
+            if dialog.is_own(index) and not dialog.skips(index):
+                count += dialog.delete(index)
+        return self.__affected(count)
+
+    def _delete_history(self, request: messages.DeleteHistoryRequest) -> Any:
+        dialog = self.__dialog(request.peer)
+        last = dialog.size - 1
+        if request.max_id:
+            last = min(last, request.max_id - dialog.first_id)
+        count = sum(dialog.delete(index) for index in range(last + 1))
+        affected = self.__affected(count)
+        return messages_types.AffectedHistory(
+            pts=affected.pts, pts_count=affected.pts_count, offset=0
+        )
+
+    def _delete_participant_history(
+        self, request: channels.DeleteParticipantHistoryRequest
+    ) -> Any:
+        dialog = self.__dialog(request.channel)
+        if not dialog.entity.creator:
+            raise ChatAdminRequiredError(request=request)
+        indices = dialog.select(
+            dialog.size - 1, -1, True, None, self.PARTICIPANT_HISTORY_CHUNK
+        )
+        affected = self.__affected(sum(dialog.delete(index) for index in indices))
+        more = len(indices) == self.PARTICIPANT_HISTORY_CHUNK
+        return messages_types.AffectedHistory(
+            pts=affected.pts, pts_count=affected.pts_count, offset=int(more)
+        )
+
+    def _get_messages(self, request: Any) -> Any:
+        dialog = None
+        if isinstance(request, channels.GetMessagesRequest):
+            dialog = self.__dialog(request.channel)
+        found = []
+        for input_message in request.id:
+            message_id = input_message.id
+            target = dialog
+            if target is None:
+                target = self.__shared_dialog(message_id)
+            index = message_id - target.first_id if target else -1
+            if target is None or not 0 <= index < target.size:
+                found.append(MessageEmpty(id=message_id))
+            else:
+                found.append(target.message(index))
+        return self.__result(dialog, found, len(found))
+
+    def _get_dialogs(self, request: messages.GetDialogsRequest) -> Any:
+        top = [d.message(d.size - 1) for d in self.dialogs]
+        dialogs = [
+            Dialog(
+                peer=d.peer,
+                top_message=m.id,
+                read_inbox_max_id=m.id,
+                read_outbox_max_id=m.id,
+                unread_count=0,
+                unread_mentions_count=0,
+                unread_reactions_count=0,
+                unread_poll_votes_count=0,
+                notify_settings=PeerNotifySettings(),
+            )
+            for d, m in zip(self.dialogs, top)
+        ]
+        result = self.__result(None, top, len(top))
+        return messages_types.Dialogs(
+            dialogs=dialogs, messages=top, chats=result.chats, users=result.users
+        )
+
+    def _get_users(self, request: GetUsersRequest) -> Any:
+        users = []
+        for input_user in request.id:
+            if isinstance(input_user, InputUserSelf):
+                users.append(self.me)
+            elif input_user.user_id in (SELF_ID, OTHER_ID):
+                users.append(self.me if input_user.user_id == SELF_ID else self.other)
+            else:
+                users.append(self.__dialog(PeerUser(input_user.user_id)).entity)
+        return users
+
+    def _get_channels(self, request: channels.GetChannelsRequest) -> Any:
+        return messages_types.Chats(
+            chats=[self.__dialog(c).entity for c in request.id]
+        )
+
+    def _get_chats(self, request: messages.GetChatsRequest) -> Any:
+        return messages_types.Chats(
+            chats=[self.__dialog(PeerChat(chat_id)).entity for chat_id in request.id]
+        )
+
+    def _resolve_username(self, request: ResolveUsernameRequest) -> Any:
+        for dialog in self.dialogs:
+            if getattr(dialog.entity, "username", None) == request.username:
+                result = self.__result(None, [], 0)
+                return contacts.ResolvedPeer(
+                    peer=dialog.peer, chats=result.chats, users=result.users
+                )
+        raise UsernameNotOccupiedError(request=request)
+
+    def _init_takeout(self, request: account.InitTakeoutSessionRequest) -> Any:
+        if self.takeout_delay:
+            raise TakeoutInitDelayError(request=request, capture=self.takeout_delay)
+        return account_types.Takeout(id=1)
+
+    def _finish_takeout(self, request: account.FinishTakeoutSessionRequest) -> Any:
+        return True
+
+    def _get_file(self, request: upload.GetFileRequest) -> Any:
+        size = FILE_SIZES[request.location.id]
+        part = max(0, min(request.limit, size - request.offset))
+        return upload_types.File(type=storage.FileUnknown(), mtime=0, bytes=bytes(part))
+
+    HANDLERS = {
+        messages.SearchRequest: _search,
+        messages.GetHistoryRequest: _get_history,
+        messages.SearchGlobalRequest: _search_global,
+        messages.DeleteMessagesRequest: _delete_messages,
+        channels.DeleteMessagesRequest: _delete_channel_messages,
+        messages.DeleteHistoryRequest: _delete_history,
+        channels.DeleteParticipantHistoryRequest: _delete_participant_history,
+        messages.GetMessagesRequest: _get_messages,
+        channels.GetMessagesRequest: _get_messages,
+        messages.GetDialogsRequest: _get_dialogs,
+        GetUsersRequest: _get_users,
+        channels.GetChannelsRequest: _get_channels,
+        messages.GetChatsRequest: _get_chats,
+        ResolveUsernameRequest: _resolve_username,
+        account.InitTakeoutSessionRequest: _init_takeout,
+        account.FinishTakeoutSessionRequest: _finish_takeout,
+        upload.GetFileRequest: _get_file,
+    }
+
+
+class FakeEraser(Eraser):
+    """
+    Eraser whose requests never leave the process: they still go through
+    the rate limiter and FloodWait handling, but are answered by the backend
+    """
+
+    def __init__(self, backend: FakeTelegram, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.backend = backend
+
+    async def connect(self) -> None:
+        return None
+
+    async def _borrow_exported_sender(self, dc_id: int) -> Any:
+        # Media of every DC are served by the backend too
+        return self._sender
+
+    async def _return_exported_sender(self, sender: Any) -> None:
+        return None
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def _call(
+        self,
+        sender: Any,
+        request: Any,
+        ordered: bool = False,
+        flood_sleep_threshold: Any = None,
+    ) -> Any:
+        requests = request if isinstance(request, list) else [request]
+        results = []
+        for item in requests:
+            await item.resolve(self, utils)
+            result = await self.backend.handle(item)
+            self.session.process_entities(result)
+            results.append(result)
+        return results if isinstance(request, list) else results[0]
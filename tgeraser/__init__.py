@@ -1,5 +1,15 @@
 """
 __init__.py
 """
+from typing import Any
+
 from . import __version__
-from .eraser import Eraser
+
+
+def __getattr__(name: str) -> Any:
+    # Eraser pulls in the whole of Telethon, so it's imported on first use
+    if name == "Eraser":
+        from .eraser import Eraser
+
+        return Eraser
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
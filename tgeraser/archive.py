@@ -0,0 +1,124 @@
+"""
+Archive of messages written before they are deleted
+"""
+
+import asyncio
+import json
+import os
+from typing import IO, Any, Awaitable, List
+
+from telethon import TelegramClient, utils
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Message
+
+
+class Archive:
+    """
+    Copy of own messages kept before they are deleted. Metadata and text of
+    every message are appended to `<peer ID>/messages.jsonl` in the directory
+    as soon as its page arrives, and media are downloaded to `<peer ID>/media`
+    by a pool of at most `workers` downloads at a time. Adding a batch waits
+    for a free worker, so a slow archive holds the scan back instead of
+    piling up messages in memory.
+    """
+
+    def __init__(self, directory: str, workers: int = 4) -> None:
+        self.__directory = directory
+        self.__workers = asyncio.Semaphore(workers)
+        self.__files: dict[int, IO[str]] = {}
+        self.__counts = {"messages": 0, "media": 0}
+
+    def counts(self) -> dict[str, int]:
+        """
+        Numbers of archived messages and downloaded media files
+        """
+        return dict(self.__counts)
+
+    async def add(
+        self, client: TelegramClient, peer_id: int, batch: List[Message]
+    ) -> Awaitable[None]:
+        """
+        Writes the metadata of a batch and starts downloading its media.
+        Returns an awaitable which is done once the whole batch is on disk;
+        it raises if a download failed, so the batch isn't deleted.
+        """
+        file = self._file(peer_id)
+        downloads = []
+        for msg in batch:
+            media = self._media_path(peer_id, msg)
+            file.write(json.dumps(self._metadata(msg, media), ensure_ascii=False))
+            file.write("\n")
+            if media is not None:
+                await self.__workers.acquire()
+                downloads.append(
+                    asyncio.create_task(self._download(client, msg, media))
+                )
+        file.flush()
+        self.__counts["messages"] += len(batch)
+        return asyncio.gather(asyncio.to_thread(os.fsync, file.fileno()), *downloads)
+
+    def close(self) -> None:
+        """
+        Closes the message files
+        """
+        for file in self.__files.values():
+            file.close()
+        self.__files.clear()
+
+    def _file(self, peer_id: int) -> IO[str]:
+        """
+        Returns the message file of a peer, opened for appending
+        """
+        if peer_id not in self.__files:
+            path = os.path.join(self.__directory, str(peer_id))
+            os.makedirs(os.path.join(path, "media"), exist_ok=True)
+            self.__files[peer_id] = open(
+                os.path.join(path, "messages.jsonl"), "a", encoding="utf-8"
+            )
+        return self.__files[peer_id]
+
+    def _media_path(self, peer_id: int, msg: Message) -> str | None:
+        """
+        Returns the path a photo or document of the message is downloaded to
+        """
+        media = getattr(msg, "media", None)
+        if not (getattr(media, "photo", None) or getattr(media, "document", None)):
+            return None
+        name = f"{msg.id}{utils.get_extension(media)}"
+        return os.path.join(self.__directory, str(peer_id), "media", name)
+
+    async def _download(self, client: TelegramClient, msg: Message, path: str) -> None:
+        """
+        Downloads media of a message, freeing its worker when done.
+        Downloads don't go through Eraser.__call__, so FloodWaits of
+        upload.getFile are slept through here and the download is retried.
+        """
+        try:
+            while True:
+                try:
+                    await client.download_media(msg, file=path)
+                    break
+                except FloodWaitError as err:
+                    await asyncio.sleep(err.seconds)
+            self.__counts["media"] += 1
+        finally:
+            self.__workers.release()
+
+    def _metadata(self, msg: Message, media: str | None) -> dict[str, Any]:
+        """
+        Returns what is archived of a message besides its media
+        """
+        # Service messages have an action instead of text and media
+        edit_date = getattr(msg, "edit_date", None)
+        action = getattr(msg, "action", None)
+        return {
+            "id": msg.id,
+            "peer_id": utils.get_peer_id(msg.peer_id),
+            "date": msg.date.isoformat(),
+            "edit_date": edit_date.isoformat() if edit_date else None,
+            "message": getattr(msg, "message", None),
+            "reply_to_msg_id": getattr(msg.reply_to, "reply_to_msg_id", None),
+            "grouped_id": getattr(msg, "grouped_id", None),
+            "media": os.path.relpath(media, self.__directory) if media else None,
+            "action": type(action).__name__ if action else None,
+        }
@@ -2,24 +2,81 @@
 TgEraser deletes all your messages from a chat/channel/conversation on Telegram without requiring admin privileges.
 
 Usage:
-    tgeraser [(session <session_name>) --entity-type TYPE -l NUM -d PATH -p PEER_ID -o STRING -m TYPES --delete-conversation --proxy HOST:PORT:SECRET]
-    tgeraser session <session_name> -w [--entity-type TYPE -o STRING -m TYPES --delete-conversation --proxy HOST:PORT:SECRET]
+    tgeraser [(session <session_name>) --entity-type TYPE -l NUM -d PATH -p PEER_ID --peers-file PATH -o STRING --newer-than STRING --between START,END -m TYPES --delete-conversation --concurrency NUM --scan-workers NUM --takeout --archive DIR --archive-workers NUM --resume --incremental --dialogs-ttl SECONDS --refresh-dialogs --plan --json PATH --daemon --metrics-json PATH --metrics-prom PATH --profile PATH --trace-memory --session-backend NAME --proxy HOST:PORT:SECRET]
+    tgeraser session <session_name> -w [--global-search --entity-type TYPE -o STRING --newer-than STRING --between START,END -m TYPES --delete-conversation --concurrency NUM --scan-workers NUM --takeout --archive DIR --archive-workers NUM --resume --incremental --dialogs-ttl SECONDS --refresh-dialogs --plan --json PATH --daemon --metrics-json PATH --metrics-prom PATH --profile PATH --trace-memory --session-backend NAME --proxy HOST:PORT:SECRET]
+    tgeraser (--all-sessions | --sessions NAMES) -w [--global-search --entity-type TYPE -d PATH -o STRING --newer-than STRING --between START,END -m TYPES --delete-conversation --concurrency NUM --scan-workers NUM --takeout --archive DIR --archive-workers NUM --resume --incremental --dialogs-ttl SECONDS --refresh-dialogs --max-accounts NUM --metrics-json PATH --metrics-prom PATH --profile PATH --trace-memory --session-backend NAME --proxy HOST:PORT:SECRET]
+    tgeraser (--all-sessions | --sessions NAMES) (-p PEER_ID | --peers-file PATH) [--entity-type TYPE -d PATH -o STRING --newer-than STRING --between START,END -m TYPES --delete-conversation --concurrency NUM --scan-workers NUM --takeout --archive DIR --archive-workers NUM --resume --incremental --dialogs-ttl SECONDS --refresh-dialogs --max-accounts NUM --metrics-json PATH --metrics-prom PATH --profile PATH --trace-memory --session-backend NAME --proxy HOST:PORT:SECRET]
+    tgeraser [(session <session_name>)] --policy FILE [-d PATH --concurrency NUM --scan-workers NUM --takeout --archive DIR --archive-workers NUM --resume --dialogs-ttl SECONDS --refresh-dialogs --metrics-json PATH --metrics-prom PATH --profile PATH --trace-memory --session-backend NAME --proxy HOST:PORT:SECRET]
     tgeraser -h | --help
     tgeraser --version
 
 Options:
     -d --directory PATH         Specify a directory where your sessions are stored. [default: ~/.tgeraser/]
     -w --wipe-everything        Delete all messages from all entities of a certain type that you have in your dialog list.
+    --global-search             With -w and -m, find own messages of the media types in all dialogs at once
+                                using global search instead of scanning every dialog (no checkpoints or
+                                --incremental). Telegram's global search needs a media filter.
     --delete-conversation       If set, delete the whole conversation (only valid for user-type peers).
     --entity-type TYPE          Available types: any, chat, channel, user. [default: chat]
     -p --peers PEER_ID          Specify certain peers by comma (chat/channel/user).
+    --peers-file PATH           Read peers from a file, one per line (IDs or usernames).
+                                Access hashes of resolved peers are cached for a week, so a rerun doesn't
+                                resolve them again.
     -l --limit NUM              Show a specified number of recent chats.
     -o --older-than STRING      Delete messages older than X seconds/minutes/hours/days/weeks.
                                 Example: --older-than "3*days" OR --older-than "5*seconds"
+                                An absolute date works too: --older-than 2024-01-31 (local time).
+    --newer-than STRING         Delete only messages newer than X seconds/minutes/hours/days/weeks
+                                or than a date. Example: --newer-than "2*days" OR --newer-than 2024-01-31
+    --between START,END         Delete only messages sent between two dates or periods ago.
+                                Example: --between 2021-03-01,2021-04-01 OR --between "30*days,7*days"
     -m --media-type TYPES       Delete only specific media types (server-side filtering).
                                 Comma-separated list of: photo, video, audio, voice, video_note, gif, document.
                                 Use "media" to delete all media types. If not specified, deletes all messages.
                                 Example: --media-type "photo,video" OR --media-type media
+    --policy FILE               Apply the rules of a retention policy file (TOML or JSON) in one run. Every rule
+                                has peers or entity_type and optionally older_than, newer_than and media_types
+                                with the values of the options above; rules of the same entity share one scan.
+    --concurrency NUM           Number of entities processed at the same time. [default: 1]
+    --scan-workers NUM          Split the message IDs of every entity into this many ranges
+                                scanned at the same time (for very large chats). [default: 1]
+    --takeout                   Scan through a takeout session, which has looser flood limits for reading
+                                history (Telegram asks to allow it from another app first). Deletes are
+                                sent by the normal session.
+    --archive DIR               Keep a copy of own messages before deleting them: metadata and text are written
+                                to DIR/<peer ID>/messages.jsonl and media downloaded to DIR/<peer ID>/media.
+                                A batch is only deleted once it is archived.
+    --archive-workers NUM       Number of media downloaded at the same time with --archive. [default: 4]
+    --resume                    Continue an interrupted run: skip finished entities and
+                                continue the unfinished ones from the last deleted message.
+    --incremental               Only fetch messages newer than the highest message already dealt with
+                                by a previous run (e.g. for nightly runs with --older-than).
+    --dialogs-ttl SECONDS       Reuse the dialog list cached by a previous run for this many seconds. [default: 3600]
+    --refresh-dialogs           Fetch the dialog list from Telegram even if the cached one hasn't expired,
+                                and resolve peers again instead of using their cached access hashes.
+    --plan                      Only estimate the work: count own messages per entity and media type
+                                without downloading them, and print the requests needed and an ETA.
+                                Counts of private chats include messages of the other side, so they
+                                are only upper bounds there.
+    --json PATH                 With --plan, also write the plan as JSON to the file.
+    --daemon                    Keep running and delete own messages once they are older than --older-than.
+                                The first start deletes old messages and indexes the rest; afterwards
+                                messages are indexed as they are sent, without rescanning entities.
+    --metrics-json PATH         Write metrics of the run as JSON to the file: messages scanned, requested
+                                and actually deleted per entity, requests and their latency per method,
+                                FloodWait seconds and payload bytes sent and received.
+    --metrics-prom PATH         Write the same metrics in the Prometheus text format to the file
+                                (e.g. for the textfile collector of node-exporter).
+    --profile PATH              Profile the whole run with cProfile and write the stats to the file
+                                (view them with: python -m pstats PATH).
+    --trace-memory              Trace memory allocations: print memory in use after fetching dialogs and
+                                after the scan and the deletion of every entity, and the top allocators.
+    --all-sessions              Run for every session in the sessions directory at the same time.
+    --sessions NAMES            Run for the specified sessions (comma-separated) at the same time.
+    --max-accounts NUM          Number of sessions processed at the same time. [default: 4]
+    --session-backend NAME      Where the session is kept: file (the .session file), memory (loaded from the
+                                .session file and written back after every entity and at exit) or string
+                                (read from the TG_SESSION_STRING environment variable). [default: file]
     --proxy HOST:PORT:SECRET    MTProto proxy (e.g. 1.2.3.4:443:deadbeef).
     -h --help                   Show this screen.
     --version                   Show version.
@@ -27,16 +84,30 @@ Options:
 """  # pylint: disable=line-too-long
 
 import asyncio
+import json
 import os
 import signal
 import sys
+from datetime import timedelta
+from typing import TYPE_CHECKING, Callable
 
 from docopt import docopt
 
 from .__version__ import VERSION
-from .eraser import Eraser
 from .exceptions import TgEraserException
-from .utils import cast_to_int, get_credentials, parse_time_period
+from .metrics import write_json, write_prometheus
+from .policy import load_policy
+from .utils import (
+    cast_to_int,
+    get_credentials,
+    get_session_paths,
+    parse_time_period,
+    print_header,
+    sprint,
+)
+
+if TYPE_CHECKING:
+    from .profiling import MemoryTracer
 
 
 def _parse_proxy(proxy_str: str | None):
@@ -55,16 +126,49 @@ def _parse_proxy(proxy_str: str | None):
     return (host, port, secret)
 
 
+def _parse_date_window(arguments: dict) -> tuple[int | None, int | None]:
+    """
+    Returns how many seconds ago the messages to delete end and start
+    (--older-than and --newer-than, or both from --between)
+    """
+    older_than = newer_than = None
+    if arguments["--between"]:
+        if arguments["--older-than"] or arguments["--newer-than"]:
+            raise TgEraserException(
+                "Error: --between can't be combined with --older-than or --newer-than."
+            )
+        start, sep, end = arguments["--between"].partition(",")
+        if not sep:
+            raise TgEraserException("Error: '--between' should be START,END.")
+        newer_than = parse_time_period(start, "--between")["time"]
+        older_than = parse_time_period(end, "--between")["time"]
+    if arguments["--older-than"]:
+        older_than = parse_time_period(arguments["--older-than"], "--older-than")["time"]
+    if arguments["--newer-than"]:
+        newer_than = parse_time_period(arguments["--newer-than"], "--newer-than")["time"]
+    if older_than is not None and newer_than is not None and newer_than <= older_than:
+        raise TgEraserException(
+            "Error: the date window is empty: its start isn't before its end."
+        )
+    return older_than, newer_than
+
+
+# Called before exiting on Ctrl+C, e.g. to save the profile
+EXIT_HOOKS: list[Callable[[], None]] = []
+
+
 def signal_handler(sig=signal.SIGINT, frame=None):
     """
     Signal handler
     """
     print("\nCtrl+C captured, exiting...")
+    for hook in EXIT_HOOKS:
+        hook()
     sys.stdout.flush()
     os._exit(0)
 
 
-async def main() -> None:
+async def main(arguments: dict, memory_tracer: "MemoryTracer | None" = None) -> None:
     """
     Entry function
     """
@@ -74,28 +178,94 @@ async def main() -> None:
     else:
         signal.signal(signal.SIGINT, signal_handler)
 
-    arguments = docopt(__doc__, version=VERSION)
-    limit = cast_to_int(arguments["--limit"], "limit") if arguments["--limit"] else None
-    older_than = (
-        parse_time_period(arguments["--older-than"], "--older-than")["time"]
-        if arguments["--older-than"]
-        else None
-    )
-
     try:
+        limit = None
+        if arguments["--limit"]:
+            limit = cast_to_int(arguments["--limit"], "limit")
+        concurrency = cast_to_int(arguments["--concurrency"], "concurrency")
+        if concurrency < 1:
+            raise TgEraserException(
+                "Error: 'concurrency' should be a positive integer."
+            )
+        scan_workers = cast_to_int(arguments["--scan-workers"], "scan-workers")
+        if scan_workers < 1:
+            raise TgEraserException(
+                "Error: 'scan-workers' should be a positive integer."
+            )
+        archive_workers = cast_to_int(arguments["--archive-workers"], "archive-workers")
+        if archive_workers < 1:
+            raise TgEraserException(
+                "Error: 'archive-workers' should be a positive integer."
+            )
+        older_than, newer_than = _parse_date_window(arguments)
+        if arguments["--daemon"] and arguments["--archive"]:
+            raise TgEraserException("Error: --daemon can't be combined with --archive.")
+        if arguments["--daemon"]:
+            if older_than is None or newer_than is not None:
+                raise TgEraserException(
+                    "Error: --daemon needs --older-than "
+                    "and no --newer-than or --between."
+                )
+            if not (
+                arguments["--wipe-everything"]
+                or arguments["--peers"]
+                or arguments["--peers-file"]
+            ):
+                raise TgEraserException(
+                    "Error: --daemon needs -w, --peers or --peers-file."
+                )
+
         credentials = await get_credentials(arguments)
         kwargs = {
             **credentials,
             "peers": arguments["--peers"],
+            "peers_file": arguments["--peers-file"],
             "limit": limit,
             "wipe_everything": arguments["--wipe-everything"],
+            "global_search": arguments["--global-search"],
             "entity_type": arguments["--entity-type"],
             "older_than": older_than,
+            "newer_than": newer_than,
             "delete_conversation": arguments["--delete-conversation"],
+            "concurrency": concurrency,
+            "scan_workers": scan_workers,
+            "takeout": arguments["--takeout"],
+            "archive": arguments["--archive"],
+            "archive_workers": archive_workers,
+            "resume": arguments["--resume"],
+            "incremental": arguments["--incremental"],
+            "dialogs_ttl": cast_to_int(arguments["--dialogs-ttl"], "dialogs-ttl"),
+            "refresh_dialogs": arguments["--refresh-dialogs"],
             "media_types": arguments["--media-type"],
+            "plan": arguments["--plan"],
+            "policy": (
+                load_policy(arguments["--policy"]) if arguments["--policy"] else None
+            ),
+            "daemon": arguments["--daemon"],
+            "metrics": bool(arguments["--metrics-json"] or arguments["--metrics-prom"]),
+            "memory_tracer": memory_tracer,
+            "session_backend": arguments["--session-backend"],
             "proxy": _parse_proxy(arguments.get("--proxy")),
         }
-        await run_eraser(kwargs)
+        if arguments["--all-sessions"] or arguments["--sessions"]:
+            max_accounts = cast_to_int(arguments["--max-accounts"], "max-accounts")
+            if max_accounts < 1:
+                raise TgEraserException(
+                    "Error: 'max-accounts' should be a positive integer."
+                )
+            if arguments["--session-backend"] == "string":
+                raise TgEraserException(
+                    "Error: --session-backend string can't be used "
+                    "with several sessions."
+                )
+            results = await run_erasers(
+                kwargs, get_session_paths(arguments), max_accounts
+            )
+            save_metrics([r["metrics"] for r in results], arguments)
+        elif arguments["--plan"]:
+            print_plan(await run_eraser(kwargs), arguments["--json"])
+        else:
+            save_metrics([(await run_eraser(kwargs))["metrics"]], arguments)
     except ValueError as err:
         print(f"ValueError: {err}")
     except TgEraserException as err:
@@ -104,23 +274,145 @@ async def main() -> None:
         raise TgEraserException(f"An unexpected error occurred: {err}") from err
 
 
-async def run_eraser(kwargs: dict) -> None:
+async def run_eraser(kwargs: dict) -> dict:
     """
     Runs the eraser
     """
+    from .eraser import Eraser  # Telethon is only imported when it's needed
+
     client = Eraser(**kwargs)
+    EXIT_HOOKS.append(client.flush_session)
     try:
         await client.init()
-        await client.run()
+        if kwargs.get("plan"):
+            return await client.plan()
+        if kwargs.get("daemon"):
+            return await client.run_daemon()
+        return await client.run()
     finally:
+        EXIT_HOOKS.remove(client.flush_session)
         await client.disconnect()
 
 
+def print_plan(plan: dict, json_path: str | None) -> None:
+    """
+    Prints the plan and writes it as JSON if a path is given
+    """
+    print_header("Plan")
+    for entity in plan["entities"]:
+        media = ", ".join(f"{name}: {count}" for name, count in entity["media"].items())
+        if "non_media" in entity:
+            media += f", non-media (text and service): {entity['non_media']}"
+        at_most = "at most " if entity["upper_bound"] else ""
+        sprint(
+            f"{entity['name']}\t | {entity['id']}: {at_most}{entity['to_delete']} "
+            f"to delete of {entity['total']} own messages ({media})"
+        )
+    at_most = "at most " if plan["upper_bound"] else ""
+    sprint(
+        f"\nTotal: {at_most}{plan['messages']} messages, ~{plan['scan_requests']} "
+        f"scan and ~{plan['delete_requests']} delete requests, "
+        f"ETA {timedelta(seconds=plan['eta_seconds'])}."
+    )
+    if plan["upper_bound"]:
+        sprint(
+            "Counts of private chats are upper bounds: "
+            "they include messages of the other side."
+        )
+
+    if json_path:
+        with open(json_path, "w") as file:
+            json.dump(plan, file, indent=2)
+        sprint(f"Plan saved to '{json_path}' file.")
+
+
+def save_metrics(runs: list[dict], arguments: dict) -> None:
+    """
+    Writes metrics of the runs to the files given by --metrics-json and --metrics-prom
+    """
+    if arguments["--metrics-json"]:
+        write_json(arguments["--metrics-json"], runs)
+        sprint(f"Metrics saved to '{arguments['--metrics-json']}' file.")
+    if arguments["--metrics-prom"]:
+        write_prometheus(arguments["--metrics-prom"], runs)
+        sprint(f"Metrics saved to '{arguments['--metrics-prom']}' file.")
+
+
+async def run_erasers(
+    kwargs: dict, session_names: list[str], max_accounts: int
+) -> list[dict]:
+    """
+    Runs an eraser per session, up to `max_accounts` at the same time,
+    and prints a combined summary. Returns summaries of successful runs.
+    """
+    semaphore = asyncio.Semaphore(max_accounts)
+
+    async def run_session(session_name: str) -> dict:
+        async with semaphore:
+            return await run_eraser(
+                {
+                    **kwargs,
+                    "session_name": session_name,
+                    "label": os.path.basename(session_name),
+                    "interactive": False,
+                }
+            )
+
+    results = await asyncio.gather(
+        *(run_session(name) for name in session_names), return_exceptions=True
+    )
+
+    print_header("Summary")
+    totals = {"entities": 0, "found": 0, "requested": 0, "undeletable": 0}
+    succeeded = []
+    for session_name, result in zip(session_names, results):
+        label = os.path.basename(session_name)
+        if isinstance(result, BaseException):
+            sprint(f"{label}: failed: {result}")
+            continue
+        succeeded.append(result)
+        for key in totals:
+            totals[key] += result[key]
+        sprint(
+            f"{label}: {result['entities']} entities, "
+            f"{result['found']} messages found, "
+            f"{result['requested']} requested for deletion, "
+            f"{result['undeletable']} undeletable in {result['duration']}"
+        )
+    sprint(
+        f"\nTotal: {len(succeeded)} of {len(session_names)} sessions, "
+        f"{totals['entities']} entities, {totals['found']} messages found, "
+        f"{totals['requested']} requested for deletion, "
+        f"{totals['undeletable']} undeletable."
+    )
+    return succeeded
+
+
 def entry() -> None:
     """
     Entry point function
     """
-    asyncio.run(main())
+    arguments = docopt(__doc__, version=VERSION)
+    profiler = memory_tracer = None
+    if arguments["--profile"] or arguments["--trace-memory"]:
+        from .profiling import MemoryTracer, Profiler
+
+        if arguments["--profile"]:
+            profiler = Profiler(arguments["--profile"])
+            EXIT_HOOKS.append(profiler.stop)
+        if arguments["--trace-memory"]:
+            memory_tracer = MemoryTracer()
+            EXIT_HOOKS.append(memory_tracer.report)
+            memory_tracer.start()
+        if profiler is not None:
+            profiler.start()
+    try:
+        asyncio.run(main(arguments, memory_tracer))
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if memory_tracer is not None:
+            memory_tracer.report()
 
 
 if __name__ == "__main__":
@@ -2,33 +2,135 @@
 Eraser class
 """
 
+import asyncio
+import os
 import platform
+import sys
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from getpass import getpass
-from typing import Any, List
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Iterator,
+    List,
+    NamedTuple,
+    TypeVar,
+)
 
-from telethon import TelegramClient, hints
-from telethon.errors import SessionPasswordNeededError
+from telethon import TelegramClient, events, hints
+from telethon.errors import (
+    ChatAdminRequiredError,
+    FloodPremiumWaitError,
+    FloodWaitError,
+    RPCError,
+    SearchQueryEmptyError,
+    SessionPasswordNeededError,
+    TakeoutInitDelayError,
+)
+from telethon.extensions import BinaryReader
 from telethon.network import ConnectionTcpAbridged, ConnectionTcpMTProxyRandomizedIntermediate
+from telethon.sessions import StringSession
+from telethon.tl.functions import InvokeWithTakeoutRequest, channels, messages
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.tlobject import TLRequest
 from telethon.tl.types import (
     Channel,
     Chat,
+    DocumentAttributeAnimated,
+    DocumentAttributeAudio,
+    DocumentAttributeSticker,
+    DocumentAttributeVideo,
     InputMessagesFilterDocument,
+    InputMessagesFilterEmpty,
     InputMessagesFilterGif,
     InputMessagesFilterMusic,
     InputMessagesFilterPhotos,
     InputMessagesFilterRoundVideo,
     InputMessagesFilterVideo,
     InputMessagesFilterVoice,
+    InputPeerChannel,
+    InputPeerChat,
+    InputPeerEmpty,
+    InputPeerSelf,
+    InputPeerUser,
     InputUserSelf,
+    Message,
+    MessageMediaDocument,
+    MessageMediaPhoto,
+    PeerChat,
+    PeerUser,
+    TypeInputPeer,
     TypeMessagesFilter,
     User,
 )
-from telethon.utils import get_display_name
+from telethon.tl.types.messages import Messages as MessagesMessages
+from telethon.utils import (
+    get_display_name,
+    get_input_channel,
+    get_input_peer,
+    get_input_user,
+    get_peer_id,
+    resolve_id,
+)
 
 from .__version__ import VERSION
+from .archive import Archive
 from .exceptions import TgEraserException
-from .utils import async_input, cast_to_int, print_header, sprint
+from .idset import MessageIdSet
+from .metrics import RunMetrics
+from .policy import PolicyRule
+from .ratelimit import RateLimiter
+from .sessions import MemorySQLiteSession, open_session
+from .state import StateStore
+from .utils import (
+    EntityOutput,
+    async_input,
+    cast_to_int,
+    gather_or_cancel,
+    print_header,
+    sprint,
+)
+
+
+T = TypeVar("T")
+
+# Items of the delete stream: the scan or the peer, message IDs and, with
+# an archive, what finishes once the batch is archived
+Batch = tuple[str, List[int], Awaitable[None] | None]
+PeerBatch = tuple[hints.Entity, List[int], Awaitable[None] | None]
+
+
+class Rule(NamedTuple):
+    """
+    A policy rule compiled for a run: own messages sent before `before`
+    and after `after`, of the media types if any are given
+    """
+
+    before: datetime | None
+    after: datetime | None
+    media_types: frozenset[str] | None
+
+
+class Scan(NamedTuple):
+    """
+    A scan of own messages with a server-side media filter
+    and/or media types kept on the client. A shard of a scan only covers
+    message IDs above `min_id` and below `max_id`. A policy scan keeps
+    the messages matched by any of its rules.
+    """
+
+    name: str
+    media_filter: TypeMessagesFilter | None
+    media_types: frozenset[str] | None
+    min_id: int = 0
+    max_id: int = 0
+    rules: tuple[Rule, ...] | None = None
 
 
 class Eraser(TelegramClient):  # type: ignore
@@ -39,7 +141,9 @@ class Eraser(TelegramClient):  # type: ignore
     def __init__(self: TelegramClient, **kwargs: Any) -> None:
         proxy = kwargs.get("proxy")
         super().__init__(
-            session=kwargs["session_name"],
+            session=open_session(
+                kwargs.get("session_backend", "file"), kwargs["session_name"]
+            ),
             api_id=kwargs["api_id"],
             api_hash=kwargs["api_hash"],
             connection=ConnectionTcpMTProxyRandomizedIntermediate if proxy else ConnectionTcpAbridged,
@@ -47,17 +151,105 @@ class Eraser(TelegramClient):  # type: ignore
             device_model=platform.uname().system,
             system_version=platform.uname().release,
             app_version=VERSION,
+            flood_sleep_threshold=0,
         )
+        self.__rate_limiter = RateLimiter()
+        self.__metrics = RunMetrics(
+            os.path.basename(kwargs["session_name"]),
+            measure_bytes=kwargs.get("metrics", False),
+        )
+        self.__state = StateStore(kwargs["session_name"])
+        self.__resume = kwargs.get("resume", False)
+        self.__incremental = kwargs.get("incremental", False)
+        self.__interactive = kwargs.get("interactive", True)
+        self.__global_search = kwargs.get("global_search", False)
+        self.__dialogs_ttl = kwargs.get("dialogs_ttl", 0)
+        self.__refresh_dialogs = kwargs.get("refresh_dialogs", False)
+        self.__label = kwargs.get("label", "")
+        self.__memory_tracer = kwargs.get("memory_tracer")
+        self.__totals = {"entities": 0, "found": 0, "requested": 0, "undeletable": 0}
         self.__limit = kwargs["limit"]
         self.__peers = kwargs["peers"].split(",") if kwargs["peers"] else []
+        self.__peers_file = kwargs.get("peers_file")
         self.__wipe_everything = kwargs["wipe_everything"]
         self.__delete_conversation = kwargs.get("delete_conversation", False)
         self.__entity_type = kwargs["entity_type"]
         self.__older_than = kwargs["older_than"]
+        self.__newer_than = kwargs.get("newer_than")
+        self.__min_date: datetime | None = None
+        self.__concurrency = kwargs.get("concurrency") or 1
+        self.__takeout = kwargs.get("takeout", False)
+        # Client that sends scan requests: this one or its takeout session
+        self.__scanner: TelegramClient = self
+        # Peers the daemon indexes messages of (None for an entity type)
+        self.__daemon_peers: set[int] | None = None
+        self.__scan_workers = kwargs.get("scan_workers") or 1
         self.__media_filters: dict[str, TypeMessagesFilter] | None = self._parse_media_types(
             kwargs.get("media_types")
         )
+        self.__policy: List[PolicyRule] | None = kwargs.get("policy")
+        self.__entity_rules: dict[int, List[Rule]] = {}
         self.__entities: List[hints.Entity] = []
+        if self.__global_search and self.__delete_conversation:
+            raise TgEraserException(
+                "Error: --global-search can't be combined with --delete-conversation."
+            )
+        if self.__global_search and (
+            self.__peers or self.__peers_file or self.__policy is not None
+        ):
+            raise TgEraserException(
+                "Error: --global-search can't be combined with --peers, --peers-file "
+                "or --policy."
+            )
+        # messages.searchGlobal rejects an empty query without a media filter
+        if self.__global_search and not self.__media_filters:
+            raise TgEraserException("Error: --global-search needs -m/--media-type.")
+        # Every account has its own directory in a run over several sessions
+        self.__archive: Archive | None = None
+        if kwargs.get("archive"):
+            if self.__delete_conversation:
+                raise TgEraserException(
+                    "Error: --archive can't be combined with --delete-conversation."
+                )
+            self.__archive = Archive(
+                os.path.join(kwargs["archive"], self.__label),
+                kwargs.get("archive_workers") or 4,
+            )
+
+    REQUEST_CLASSES: dict[type, str] = {
+        messages.GetHistoryRequest: "history",
+        messages.SearchRequest: "search",
+        messages.SearchGlobalRequest: "search",
+        messages.DeleteMessagesRequest: "delete",
+        messages.DeleteHistoryRequest: "delete",
+        channels.DeleteMessagesRequest: "delete",
+        channels.DeleteParticipantHistoryRequest: "delete",
+        ResolveUsernameRequest: "resolve",
+    }
+    FLOOD_SLEEP_THRESHOLD = 60
+
+    PEERS_CHUNK_SIZE = 100
+    PEERS_TTL = 7 * 86400
+
+    DELETE_BATCH_SIZE = 100
+    PENDING_BATCHES = 4
+    DELETE_RETRIES = 2
+    SHOWN_IDS = 20
+
+    SHARD_SEPARATOR = "@"
+    MIN_SHARD_IDS = 1000
+
+    DAEMON_INTERVAL = 60
+
+    POLICY_SCAN = "policy"
+
+    ENTITY_FILTERS: dict[str, Callable[[Any], bool]] = {
+        "any": lambda e: True,
+        "user": lambda e: isinstance(e, User) and not e.is_self,
+        "chat": lambda e: isinstance(e, Chat)
+        or (isinstance(e, Channel) and (e.megagroup or e.gigagroup)),
+        "channel": lambda e: isinstance(e, Channel) and not e.megagroup,
+    }
 
     MEDIA_TYPE_FILTERS: dict[str, type[TypeMessagesFilter]] = {
         "photo": InputMessagesFilterPhotos,
@@ -95,6 +287,81 @@ class Eraser(TelegramClient):  # type: ignore
 
         return filters if filters else None
 
+    async def __call__(
+        self, request: Any, ordered: bool = False, flood_sleep_threshold: Any = None
+    ) -> Any:
+        """
+        Sends every request through the rate limiter of its request class
+        and records it in the run metrics.
+        FloodWaits of history, search and delete requests are always slept off;
+        other requests keep the usual threshold.
+        """
+        request_class = self._request_class(request)
+        request_name = self._request_name(request)
+        bucket = self.__rate_limiter.bucket(request_class)
+        while True:
+            await bucket.acquire()
+            sent_at = time.monotonic()
+            try:
+                result = await super().__call__(request, ordered=ordered)
+            except (FloodWaitError, FloodPremiumWaitError) as err:
+                self.__metrics.observe_rpc(
+                    request_name, time.monotonic() - sent_at, request, failed=True
+                )
+                if (
+                    request_class == "other"
+                    and err.seconds > self.FLOOD_SLEEP_THRESHOLD
+                ):
+                    raise
+                bucket.on_flood_wait(err.seconds)
+                self.__metrics.observe_flood_wait(request_class, err.seconds)
+                print(
+                    f"FloodWait of {err.seconds}s on {request_class} requests, "
+                    f"slowing down to {bucket.rate:.2f} requests/s."
+                )
+                continue
+            except Exception:
+                self.__metrics.observe_rpc(
+                    request_name, time.monotonic() - sent_at, request, failed=True
+                )
+                raise
+            self.__metrics.observe_rpc(
+                request_name, time.monotonic() - sent_at, request, result
+            )
+            bucket.on_success()
+            return result
+
+    def _request_class(self, request: Any) -> str:
+        """
+        Returns the rate limiting class of a request or a list of requests.
+        Requests of a takeout session have their own class and limits.
+        """
+        first = request[0] if isinstance(request, list) and request else request
+        if isinstance(first, InvokeWithTakeoutRequest):
+            return "takeout"
+        return self.REQUEST_CLASSES.get(type(self._unwrap(request)), "other")
+
+    def _request_name(self, request: Any) -> str:
+        """
+        Returns the method name of a request or a list of requests for the metrics
+        """
+        request = self._unwrap(request)
+        if request is None:
+            return "none"
+        module = type(request).__module__.rsplit(".", 1)[-1]
+        return f"{module}.{type(request).__name__.removesuffix('Request')}"
+
+    @staticmethod
+    def _unwrap(request: Any) -> Any:
+        """
+        Returns the first request of a list without InvokeWith* wrappers
+        """
+        if isinstance(request, list):
+            request = request[0] if request else None
+        while isinstance(getattr(request, "query", None), TLRequest):
+            request = request.query
+        return request
+
     async def init(self) -> None:
         """
         Initializes the client
@@ -118,6 +385,10 @@ class Eraser(TelegramClient):  # type: ignore
         Authorizes the user
         """
         if not await self.is_user_authorized():
+            if not self.__interactive:
+                raise TgEraserException(
+                    f"Session '{self.__label}' isn't authorized. Log in with it first."
+                )
             print("First run. Sending code request...")
             user_phone = await async_input("Enter your phone: ")
             await self.sign_in(user_phone)
@@ -135,156 +406,1374 @@ class Eraser(TelegramClient):  # type: ignore
 
                     self_user = await self.sign_in(password=password)
 
-    async def run(self) -> None:
+            if isinstance(self.session, StringSession):
+                print(
+                    "\nSession string (keep it secret, set TG_SESSION_STRING "
+                    f"to it to skip the login next time):\n{self.session.save()}\n"
+                )
+
+    def flush_session(self) -> None:
         """
-        Runs deletion of messages from peer
+        Writes an in-memory session to its file
         """
-        await self._determine_entities()
+        if isinstance(self.session, MemorySQLiteSession):
+            self.session.flush()
+
+    def disconnect(self) -> Any:
+        """
+        Closes the state store and disconnects from Telegram
+        (which writes the session)
+        """
+        self.__state.close()
+        if self.__archive is not None:
+            self.__archive.close()
+        return super().disconnect()
+
+    async def run(self) -> dict[str, Any]:
+        """
+        Runs deletion of messages from peer.
+        Returns a summary with the numbers of processed entities,
+        found messages, messages requested for deletion and the ones
+        that couldn't be deleted, the duration
+        and the metrics of the run.
+        """
+        self.__metrics.start()
+        if not self.__global_search:
+            await self._determine_entities()
+            self._apply_checkpoint()
+        self.__totals = {"entities": 0, "found": 0, "requested": 0, "undeletable": 0}
+        prefix = f"[{self.__label}] " if self.__label else ""
 
         start_time = datetime.now()
-        print(f"\nDeletion started at: {start_time.isoformat()} (local)")
+        print(f"\n{prefix}Deletion started at: {start_time.isoformat()} (local)")
 
-        await self._delete_messages_from_entities()
+        global_search = self.__global_search
+        async with self._takeout_scans():
+            if global_search:
+                try:
+                    await self._wipe_with_global_search()
+                except SearchQueryEmptyError:
+                    print(
+                        "Global search without a query isn't available, "
+                        "scanning every dialog instead."
+                    )
+                    global_search = False
+                    await self._determine_entities()
+                    self._apply_checkpoint()
+            if not global_search:
+                await self._delete_messages_from_entities()
+                self.__state.reset_checkpoint()
 
         finish_time = datetime.now()
-        print(f"Deletion finished at: {finish_time.isoformat()} (local)")
-        print(f"Duration: {str(finish_time - start_time)}\n")
+        self.__metrics.finish()
+        print(f"{prefix}Deletion finished at: {finish_time.isoformat()} (local)")
+        print(f"{prefix}Duration: {str(finish_time - start_time)}\n")
+        if self.__archive is not None:
+            archived = self.__archive.counts()
+            print(
+                f"{prefix}Archived {archived['messages']} messages "
+                f"and {archived['media']} media files.\n"
+            )
+
+        self.__entities.clear()
+        return {
+            **self.__totals,
+            "duration": finish_time - start_time,
+            "metrics": self.__metrics.to_dict(),
+        }
+
+    async def run_daemon(self) -> dict[str, Any]:
+        """
+        Keeps deleting own messages as they become older than `older_than`.
+        Own messages are recorded in a time-ordered index in the state store
+        as update events arrive, and the ones missed while the daemon was down
+        are fetched with updates.getDifference on start. Only the first start
+        scans the entities: it deletes the old messages and indexes the rest.
+        Returns a summary like run() once the client is disconnected.
+        """
+        if self.__peers or self.__peers_file:
+            await self._determine_entities()
+            self.__daemon_peers = {get_peer_id(e) for e in self.__entities}
+            self.__entities.clear()
+
+        if self.__state.index_started_at() is None:
+            print_header("First start: deleting old messages and indexing the rest...")
+            cutoff = self._offset_date()
+            await self.run()
+            await self._index_recent_messages(cutoff)
+            self.__state.mark_index_started()
+
+        self.add_event_handler(
+            self._index_new_message, events.NewMessage(outgoing=True)
+        )
+        await self.catch_up()
+        print(
+            "Deleting own messages once they are older than "
+            f"{timedelta(seconds=self.__older_than)} (Ctrl+C to stop)..."
+        )
+        start_time = datetime.now()
+        while self.is_connected():
+            await self._delete_due_messages()
+            self.flush_session()
+            await asyncio.sleep(self.DAEMON_INTERVAL)
+        return {
+            **self.__totals,
+            "duration": datetime.now() - start_time,
+            "metrics": self.__metrics.to_dict(),
+        }
+
+    async def _index_recent_messages(self, cutoff: datetime | None) -> None:
+        """
+        Indexes own messages of the entities sent after the cutoff
+        """
+        await self._determine_entities()
+        for entity in self.__entities:
+            entity_id = get_peer_id(entity)
+            indexed = []
+            async for msg in self._iter_own_messages(entity, None, 0, 0, None):
+                if cutoff is not None and msg.date < cutoff:
+                    break
+                if self._is_daemon_target(msg):
+                    indexed.append((entity_id, msg.id, int(msg.date.timestamp())))
+            self.__state.index_messages(indexed)
+            print(f"Indexed {len(indexed)} messages of '{get_display_name(entity)}'.")
+        self.__entities.clear()
 
+    async def _index_new_message(self, event: events.NewMessage.Event) -> None:
+        """
+        Indexes a message just sent from any of our devices
+        """
+        msg = event.message
+        if self.__daemon_peers is not None:
+            if event.chat_id not in self.__daemon_peers:
+                return
+        elif not self.ENTITY_FILTERS[self.__entity_type](await event.get_chat()):
+            return
+        if self._is_daemon_target(msg):
+            self.__state.index_messages(
+                [(event.chat_id, msg.id, int(msg.date.timestamp()))]
+            )
+
+    def _is_daemon_target(self, msg: Message) -> bool:
+        """
+        Tells whether the daemon deletes the message once it's old enough
+        """
+        return self.__media_filters is None or (
+            self._media_type(msg) in self.__media_filters
+        )
+
+    async def _delete_due_messages(self) -> None:
+        """
+        Deletes indexed messages older than `older_than` in batches per entity.
+        Messages of an entity that can't be deleted from any more are dropped
+        from the index, so they don't hold up the other entities.
+        """
+        cutoff = time.time() - self.__older_than
+        while due := self.__state.due_messages(cutoff, self.DELETE_BATCH_SIZE):
+            batches: dict[int, List[int]] = {}
+            for entity_id, message_id in due:
+                batches.setdefault(entity_id, []).append(message_id)
+            for entity_id, batch in batches.items():
+                try:
+                    entity = await self.get_input_entity(entity_id)
+                except ValueError:
+                    print(f"Entity {entity_id} is unknown to the session, skipping.")
+                    self.__state.forget_messages(entity_id, batch)
+                    continue
+                metrics = self.__metrics.entity(entity_id, str(entity_id))
+                try:
+                    affected = await self._delete_verified(entity, batch, metrics)
+                except RPCError as err:
+                    # E.g. the chat was left or we were banned: retrying the
+                    # same rows would stop every later run at this entity
+                    print(f"Can't delete messages in {entity_id} ({err}), skipping.")
+                    self.__state.forget_messages(entity_id, batch)
+                    continue
+                self.__state.forget_messages(entity_id, batch)
+                self.__totals["found"] += len(batch)
+                self.__totals["requested"] += len(batch)
+                print(
+                    f"Deleted {affected} of {len(batch)} due messages in {entity_id}."
+                )
+
+    async def plan(self) -> dict[str, Any]:
+        """
+        Estimates the work of a run without downloading any messages, using one
+        count-only search per entity and media filter. Returns per-entity counts,
+        the numbers of scan and delete requests and an ETA in seconds based on
+        the current rate limits. Counts of private chats are only upper bounds.
+        """
+        await self._determine_entities()
+        offset_date = self._offset_date()
+        self.__min_date = self._min_date()
+        semaphore = asyncio.Semaphore(self.__concurrency)
+
+        async def estimate(entity: hints.Entity) -> dict[str, Any]:
+            async with semaphore:
+                return await self._estimate_entity(entity, offset_date)
+
+        async with self._takeout_scans():
+            entities = await gather_or_cancel(
+                *(estimate(e) for e in self.__entities)
+            )
         self.__entities.clear()
 
+        scan_requests = sum(e["scan_requests"] for e in entities)
+        delete_requests = sum(e["delete_requests"] for e in entities)
+        eta = max(
+            scan_requests / self.__rate_limiter.bucket("search").rate,
+            delete_requests / self.__rate_limiter.bucket("delete").rate,
+        )
+        return {
+            "entities": entities,
+            "messages": sum(e["to_delete"] for e in entities),
+            "upper_bound": any(e["upper_bound"] for e in entities),
+            "scan_requests": scan_requests,
+            "delete_requests": delete_requests,
+            "eta_seconds": round(eta),
+        }
+
+    async def _estimate_entity(
+        self, entity: hints.Entity, offset_date: datetime | None
+    ) -> dict[str, Any]:
+        """
+        Counts own messages of an entity: all of them and per media type
+        (the selected ones, or every type to show the non-media rest).
+        Searches of private chats ignore from_user, so their counts include
+        messages of the other side and are only upper bounds.
+        """
+        entity_id = get_peer_id(entity)
+        media_filters = self.__media_filters or {
+            name: media_filter()
+            for name, media_filter in self.MEDIA_TYPE_FILTERS.items()
+        }
+        scans = [Scan("all", None, None)]
+        scans.extend(Scan(name, f, None) for name, f in media_filters.items())
+        counts = await gather_or_cancel(
+            *(
+                self._count_own_messages(entity, offset_date, scan, entity_id)
+                for scan in scans
+            )
+        )
+        total, media = counts[0], dict(zip(media_filters, counts[1:]))
+
+        estimate: dict[str, Any] = {
+            "id": entity_id,
+            "name": get_display_name(entity),
+            "total": total,
+            "media": media,
+            "upper_bound": isinstance(entity, User) and not self.__delete_conversation,
+        }
+        if (
+            isinstance(entity, User) and self.__delete_conversation
+        ) or self._can_delete_participant_history(entity):
+            estimate.update(to_delete=total, scan_requests=0, delete_requests=1)
+        elif self.__media_filters is None:
+            estimate["non_media"] = max(total - sum(media.values()), 0)
+            estimate.update(
+                to_delete=total,
+                scan_requests=self._pages(total),
+                delete_requests=self._pages(total),
+            )
+        else:
+            to_delete = min(total, sum(media.values()))
+            estimate.update(
+                to_delete=to_delete,
+                scan_requests=min(
+                    sum(self._pages(count) for count in media.values()),
+                    self._pages(total),
+                ),
+                delete_requests=self._pages(to_delete),
+            )
+        return estimate
+
+    def _apply_checkpoint(self) -> None:
+        """
+        Skips entities finished by the interrupted run if resuming,
+        otherwise starts a new checkpoint
+        """
+        if not self.__resume:
+            self.__state.reset_checkpoint()
+            return
+
+        finished = self.__state.finished_entities()
+        entities = [e for e in self.__entities if get_peer_id(e) not in finished]
+        skipped = len(self.__entities) - len(entities)
+        if skipped:
+            print(
+                f"Resuming: skipping {skipped} entities "
+                "finished by the interrupted run."
+            )
+        self.__entities = entities
+
     async def _determine_entities(self) -> None:
         """
         Determines entities to delete messages from
         """
-        if self.__peers:
+        if self.__policy:
+            await self._determine_policy_entities()
+        elif self.__peers or self.__peers_file:
             await self._get_entities_by_peers()
         elif self.__wipe_everything:
             self.__entities = await self._filter_entities()
         else:
             await self._get_user_selected_entity()
 
+    async def _determine_policy_entities(self) -> None:
+        """
+        Determines entities of all policy rules and merges the rules of every
+        entity, so each entity is scanned once for all of its rules
+        """
+        peers = list(dict.fromkeys(p for rule in self.__policy for p in rule.peers))
+        by_peer = dict(zip(peers, await self._resolve_peers(peers))) if peers else {}
+        dialogs = None
+        if any(rule.entity_type for rule in self.__policy):
+            dialogs = await self._get_dialog_entities()
+
+        entities: dict[int, hints.Entity] = {}
+        self.__entity_rules = {}
+        for policy_rule in self.__policy:
+            if policy_rule.entity_type:
+                entity_filter = self.ENTITY_FILTERS[policy_rule.entity_type]
+                matched = [e for e in dialogs if entity_filter(e)]
+            else:
+                matched = [by_peer[peer] for peer in policy_rule.peers]
+            rule = self._compile_rule(policy_rule)
+            for entity in matched:
+                entity_id = get_peer_id(entity)
+                entities.setdefault(entity_id, entity)
+                self.__entity_rules.setdefault(entity_id, []).append(rule)
+        self.__entities = list(entities.values())
+
+    def _compile_rule(self, policy_rule: PolicyRule) -> Rule:
+        """
+        Turns the ages of a policy rule into dates
+        """
+        now = datetime.now(timezone.utc)
+        media_filters = self._parse_media_types(policy_rule.media_types)
+        return Rule(
+            before=None
+            if policy_rule.older_than is None
+            else now - timedelta(seconds=policy_rule.older_than),
+            after=None
+            if policy_rule.newer_than is None
+            else now - timedelta(seconds=policy_rule.newer_than),
+            media_types=frozenset(media_filters) if media_filters else None,
+        )
+
+    def _policy_scan(self, rules: List[Rule]) -> Scan:
+        """
+        Returns the single scan of an entity with policy rules. The server-side
+        media filter is only used if every rule selects the same single media type.
+        """
+        media_types = {rule.media_types for rule in rules}
+        only = next(iter(media_types))
+        media_filter = None
+        if len(media_types) == 1 and only is not None and len(only) == 1:
+            media_filter = self.MEDIA_TYPE_FILTERS[next(iter(only))]()
+        return Scan(self.POLICY_SCAN, media_filter, None, rules=tuple(rules))
+
+    def _matches_rules(self, msg: Message, rules: tuple[Rule, ...]) -> bool:
+        """
+        Tells whether any policy rule selects the message
+        """
+        media_type = self._media_type(msg)
+        return any(
+            (rule.before is None or msg.date < rule.before)
+            and (rule.after is None or msg.date >= rule.after)
+            and (rule.media_types is None or media_type in rule.media_types)
+            for rule in rules
+        )
+
     async def _get_entities_by_peers(self) -> None:
         """
-        Returns entities by peers
+        Returns entities by peers, resolving them in chunks
+        """
+        chunk: List[str] = []
+        for peer in self._iter_peers():
+            chunk.append(peer)
+            if len(chunk) >= self.PEERS_CHUNK_SIZE:
+                self.__entities.extend(await self._resolve_peers(chunk))
+                chunk = []
+        if chunk:
+            self.__entities.extend(await self._resolve_peers(chunk))
+
+    def _iter_peers(self) -> Iterator[str]:
+        """
+        Yields peers given by --peers, then the ones read line by line from --peers-file
+        (blank lines and lines starting with '#' are skipped)
         """
-        for peer in self.__peers:
-            if peer.isdigit():
-                peer = cast_to_int(peer, f"peer: {peer}")
+        yield from self.__peers
+        if not self.__peers_file:
+            return
+        try:
+            with open(self.__peers_file, "r") as file:
+                for line in file:
+                    peer = line.strip()
+                    if peer and not peer.startswith("#"):
+                        yield peer
+        except OSError as err:
+            raise TgEraserException(f"Error: can't read peers file: {err}") from err
+
+    async def _resolve_peers(self, peers: List[str]) -> List[hints.Entity]:
+        """
+        Resolves peers with as few requests as possible: access hashes of peers
+        resolved by previous runs within PEERS_TTL are taken from the state store
+        (unless dialogs are refreshed), and together with IDs known to the session
+        their entities are fetched with one batched request per peer type.
+        Usernames are resolved concurrently. If a cached peer can't be fetched,
+        e.g. because its username has moved, all peers are resolved again.
+        """
+        cached = {}
+        if not self.__refresh_dialogs:
+            cached = self.__state.load_peers(peers, self.PEERS_TTL)
+        if cached:
             try:
-                self.__entities.append(await self.get_entity(peer))
+                return await self._resolve_peers_with(peers, cached)
+            except (TgEraserException, RPCError):
+                pass
+        return await self._resolve_peers_with(peers, {})
+
+    async def _resolve_peers_with(
+        self, peers: List[str], cached: dict[str, tuple[int, int]]
+    ) -> List[hints.Entity]:
+        """
+        Resolves peers, taking the peers in `cached` from their cached
+        (marked peer ID, access hash), and caches the others
+        """
+        input_peers = {
+            peer: self._cached_input_peer(*ids) for peer, ids in cached.items()
+        }
+        missing = list(dict.fromkeys(p for p in peers if p not in cached))
+
+        usernames = []
+        for peer in missing:
+            if not peer.lstrip("-").isdigit():
+                usernames.append(peer)
+                continue
+            try:
+                input_peers[peer] = await self.get_input_entity(
+                    cast_to_int(peer, f"peer: {peer}")
+                )
             except ValueError as err:
                 raise TgEraserException(
                     f"Specified entity '{peer}' can't be found."
                 ) from err
 
-    async def _delete_messages_from_entities(self) -> None:
+        resolved = await self._get_entities_by_input_peers(input_peers)
+        entities = await gather_or_cancel(
+            *(self._get_entity_by_username(peer) for peer in usernames)
+        )
+        resolved.update(zip(usernames, entities))
+
+        self.__state.save_peers(
+            {
+                peer: (
+                    get_peer_id(resolved[peer]),
+                    getattr(resolved[peer], "access_hash", None) or 0,
+                )
+                for peer in missing
+            }
+        )
+        return [resolved[peer] for peer in peers]
+
+    @staticmethod
+    def _cached_input_peer(peer_id: int, access_hash: int) -> TypeInputPeer:
+        """
+        Builds the input peer of a marked peer ID and its access hash
         """
-        Deletes messages from entities
+        real_id, peer_type = resolve_id(peer_id)
+        if peer_type is PeerUser:
+            return InputPeerUser(real_id, access_hash)
+        if peer_type is PeerChat:
+            return InputPeerChat(real_id)
+        return InputPeerChannel(real_id, access_hash)
+
+    async def _get_entities_by_input_peers(
+        self, input_peers: dict[str, TypeInputPeer]
+    ) -> dict[str, hints.Entity]:
         """
-        offset_date = None
-        if self.__older_than is not None:
-            offset_date = datetime.now(timezone.utc) - timedelta(
-                seconds=self.__older_than
+        Fetches users, chats and channels with one request per peer type
+        """
+        peers = input_peers.values()
+        input_users = [
+            get_input_user(p)
+            for p in peers
+            if isinstance(p, (InputPeerUser, InputPeerSelf))
+        ]
+        input_channels = [
+            get_input_channel(p) for p in peers if isinstance(p, InputPeerChannel)
+        ]
+        chat_ids = [p.chat_id for p in peers if isinstance(p, InputPeerChat)]
+
+        requests: List[Any] = []
+        if input_users:
+            requests.append(GetUsersRequest(input_users))
+        if input_channels:
+            requests.append(channels.GetChannelsRequest(input_channels))
+        if chat_ids:
+            requests.append(messages.GetChatsRequest(chat_ids))
+        results = await gather_or_cancel(*(self(request) for request in requests))
+
+        by_id: dict[int, hints.Entity] = {}
+        for result in results:
+            for entity in result if isinstance(result, list) else result.chats:
+                by_id[get_peer_id(entity)] = entity
+                if getattr(entity, "is_self", False):
+                    by_id[0] = entity
+
+        resolved = {}
+        for peer, input_peer in input_peers.items():
+            if isinstance(input_peer, InputPeerSelf):
+                key = 0
+            else:
+                key = get_peer_id(input_peer)
+            if key not in by_id:
+                raise TgEraserException(f"Specified entity '{peer}' can't be found.")
+            resolved[peer] = by_id[key]
+        return resolved
+
+    async def _get_entity_by_username(self, peer: str) -> hints.Entity:
+        """
+        Resolves a username, phone or link
+        """
+        try:
+            return await self.get_entity(peer)
+        except ValueError as err:
+            raise TgEraserException(
+                f"Specified entity '{peer}' can't be found."
+            ) from err
+
+    @asynccontextmanager
+    async def _takeout_scans(self) -> AsyncIterator[None]:
+        """
+        Sends scan requests through a takeout session, which has looser flood
+        limits for reading history, while deletes stay on the normal client.
+        If Telegram delays the takeout (it has to be allowed from another
+        client first), the normal client scans instead.
+        """
+        if not self.__takeout:
+            yield
+            return
+        if self.session.takeout_id is not None:
+            # Left unfinished by an interrupted run
+            try:
+                await self.end_takeout(success=False)
+            except RPCError:
+                self.session.takeout_id = None
+        takeout = self.takeout(users=True, chats=True, megagroups=True, channels=True)
+        try:
+            await takeout.__aenter__()
+        except TakeoutInitDelayError as err:
+            print(
+                "The takeout session isn't allowed yet (allow the data export in "
+                f"another Telegram app or wait {timedelta(seconds=err.seconds)}), "
+                "scanning without it."
             )
+            takeout = None
+        if takeout is None:
+            yield
+            return
+        print("Scanning through a takeout session.")
+        self.__scanner = takeout
+        try:
+            yield
+        except BaseException:
+            # A failed run must not finish the takeout as a successful one
+            self.__scanner = self
+            await takeout.__aexit__(*sys.exc_info())
+            raise
+        self.__scanner = self
+        await takeout.__aexit__(None, None, None)
 
-        for entity in self.__entities:
-            display_name = get_display_name(entity)
+    def _trace_memory(self, phase: str) -> None:
+        """
+        Takes a memory snapshot at the end of a phase if memory is traced
+        """
+        if self.__memory_tracer is not None:
+            prefix = f"[{self.__label}] " if self.__label else ""
+            self.__memory_tracer.snapshot(prefix + phase)
 
-            if isinstance(entity, User) and self.__delete_conversation:
-                print_header(
-                    f"Deleting entire conversation with user '{display_name}'..."
-                )
-                await self.delete_dialog(entity.id, revoke=True)
-                print(f"\nDeleted entire conversation with user '{display_name}'.\n")
-                continue
+    def _offset_date(self) -> datetime | None:
+        """
+        Returns the date messages have to be older than
+        """
+        if self.__older_than is None:
+            return None
+        return datetime.now(timezone.utc) - timedelta(seconds=self.__older_than)
 
-            print_header(f"Getting messages from '{display_name}'...")
-            messages_to_delete = await self._get_messages_to_delete(
-                entity, offset_date
+    def _min_date(self) -> datetime | None:
+        """
+        Returns the date messages have to be newer than
+        """
+        if self.__newer_than is None:
+            return None
+        return datetime.now(timezone.utc) - timedelta(seconds=self.__newer_than)
+
+    async def _wipe_with_global_search(self) -> None:
+        """
+        Deletes own messages from all dialogs found by global search instead of
+        scanning every dialog. Messages are grouped by peer and deleted in batches.
+        """
+        print_header("Searching own messages in all dialogs...")
+        queue: asyncio.Queue[PeerBatch | None] = asyncio.Queue(
+            maxsize=self.PENDING_BATCHES
+        )
+        found: dict[int, int] = {}
+        requested = await self._pipe(
+            self._scan_global(queue, found), queue, self._delete_global_batches(queue)
+        )
+        self._trace_memory("global delete")
+
+        if not found:
+            print("\nNothing to delete.")
+            return
+        for peer_id, count in found.items():
+            name, deleted = requested.get(peer_id, (str(peer_id), 0))
+            metrics = self.__metrics.entity(peer_id, name)
+            sprint(
+                f"'{name}': found {count} messages, "
+                f"requested deletion of {deleted}, {metrics['affected']} deleted."
             )
-            if messages_to_delete:
-                await self._delete_messages(entity, messages_to_delete, display_name)
+            if metrics["undeletable"]:
+                sprint(f"  Can't be deleted: {self._format_ids(metrics)}")
+        self.__totals["entities"] += len(found)
+        self.__totals["found"] += sum(found.values())
+        self.__totals["requested"] += sum(n for _, n in requested.values())
 
-    async def _get_messages_to_delete(
-        self, entity: hints.Entity, offset_date: datetime | None
-    ) -> List[int]:
+    async def _scan_global(
+        self,
+        queue: "asyncio.Queue[PeerBatch | None]",
+        found: dict[int, int],
+    ) -> None:
         """
-        Gets message IDs to delete, using server-side filtering if media types specified.
+        Puts batches of own message IDs of the same peer into the queue.
+        The stream always finishes with None.
         """
-        seen: dict[int, bool] = {}
+        offset_date = self._offset_date()
+        self.__min_date = self._min_date()
+        filters = list((self.__media_filters or {None: None}).values())
+        # IDs are per channel, so every peer has its own set
+        seen: dict[int, MessageIdSet] | None = {} if len(filters) > 1 else None
+        pending: dict[int, tuple[hints.Entity, List[Any]]] = {}
+        try:
+            for media_filter in filters:
+                async for msg, entity in self._iter_global_own_messages(
+                    offset_date, media_filter
+                ):
+                    peer_id = get_peer_id(msg.peer_id)
+                    metrics = self.__metrics.entity(peer_id, get_display_name(entity))
+                    metrics["scanned"] += 1
+                    if seen is not None:
+                        if peer_id not in seen:
+                            seen[peer_id] = MessageIdSet()
+                        if not seen[peer_id].add(msg.id):
+                            continue
+                    found[peer_id] = found.get(peer_id, 0) + 1
+                    batch = pending.setdefault(peer_id, (entity, []))[1]
+                    batch.append(msg)
+                    if len(batch) >= self.DELETE_BATCH_SIZE:
+                        await self._put_global_batch(queue, *pending.pop(peer_id))
+            for entity, batch in pending.values():
+                await self._put_global_batch(queue, entity, batch)
+            self._trace_memory("global scan")
+        finally:
+            for ids in (seen or {}).values():
+                ids.close()
+            await queue.put(None)
 
-        if self.__media_filters is None:
-            messages = await self.get_messages(
-                entity,
-                from_user=InputUserSelf(),
-                limit=None,
-                wait_time=None,
-                offset_date=offset_date,
+    async def _put_global_batch(
+        self,
+        queue: "asyncio.Queue[PeerBatch | None]",
+        entity: hints.Entity,
+        batch: List[Any],
+    ) -> None:
+        """
+        Puts a batch of a peer into the delete stream, archiving it first
+        if there's an archive
+        """
+        archived = None
+        if self.__archive is not None:
+            archived = await self.__archive.add(
+                self.__scanner, get_peer_id(entity), batch
             )
-            for msg in messages:
-                seen[msg.id] = msg.action is not None
+        await queue.put((entity, [msg.id for msg in batch], archived))
+
+    async def _iter_global_own_messages(
+        self, offset_date: datetime | None, media_filter: TypeMessagesFilter | None
+    ) -> AsyncIterator[tuple[Any, hints.Entity]]:
+        """
+        Pages through messages.searchGlobal and yields own messages with their chat
+        """
+        request = messages.SearchGlobalRequest(
+            q="",
+            filter=media_filter or InputMessagesFilterEmpty(),
+            min_date=self.__min_date,
+            max_date=offset_date,
+            offset_rate=0,
+            offset_peer=InputPeerEmpty(),
+            offset_id=0,
+            limit=self.DELETE_BATCH_SIZE,
+            users_only=self.__entity_type == "user" or None,
+            groups_only=self.__entity_type == "chat" or None,
+            broadcasts_only=self.__entity_type == "channel" or None,
+        )
+        while True:
+            result = await self.__scanner(request)
+            entities = {get_peer_id(e): e for e in [*result.users, *result.chats]}
+            for msg in result.messages:
+                if getattr(msg, "out", False):
+                    yield msg, entities[get_peer_id(msg.peer_id)]
+            if not result.messages or isinstance(result, MessagesMessages):
+                return
+            last = result.messages[-1]
+            request.offset_rate = getattr(result, "next_rate", None) or 0
+            request.offset_peer = get_input_peer(entities[get_peer_id(last.peer_id)])
+            request.offset_id = last.id
+
+    async def _delete_global_batches(
+        self, queue: "asyncio.Queue[PeerBatch | None]"
+    ) -> dict[int, tuple[str, int]]:
+        """
+        Deletes batches from the queue until the stream ends.
+        Returns the name and the number of messages requested for deletion per peer.
+        """
+        requested: dict[int, tuple[str, int]] = {}
+        while (item := await queue.get()) is not None:
+            entity, batch, archived = item
+            if archived is not None:
+                await archived
+            peer_id = get_peer_id(entity)
+            name = get_display_name(entity)
+            count = requested.get(peer_id, ("", 0))[1]
+            requested[peer_id] = (name, count + len(batch))
+            metrics = self.__metrics.entity(peer_id, name)
+            await self._delete_verified(entity, batch, metrics)
+        return requested
+
+    async def _delete_messages_from_entities(self) -> None:
+        """
+        Deletes messages from entities, processing up to `concurrency` of them at once
+        """
+        offset_date = self._offset_date()
+        self.__min_date = self._min_date()
+        semaphore = asyncio.Semaphore(self.__concurrency)
+        buffered = bool(self.__label) or (
+            self.__concurrency > 1 and len(self.__entities) > 1
+        )
+
+        async def process(entity: hints.Entity) -> None:
+            async with semaphore:
+                out = EntityOutput(buffered, self.__label)
+                try:
+                    await self._process_entity(entity, offset_date, out)
+                finally:
+                    out.flush()
+
+        await gather_or_cancel(*(process(entity) for entity in self.__entities))
+
+    async def _process_entity(
+        self, entity: hints.Entity, offset_date: datetime | None, out: EntityOutput
+    ) -> None:
+        """
+        Deletes own messages or the whole conversation of a single entity
+        """
+        display_name = get_display_name(entity)
+        rules = self.__entity_rules.get(get_peer_id(entity))
+        if rules is not None:
+            # The scan starts at the newest message any of the rules selects
+            befores = [rule.before for rule in rules]
+            offset_date = None if None in befores else max(befores)
+
+        if isinstance(entity, User) and self.__delete_conversation:
+            out.header(f"Deleting entire conversation with user '{display_name}'...")
+            result = await self.delete_dialog(entity.id, revoke=True)
+            metrics = self.__metrics.entity(get_peer_id(entity), display_name)
+            metrics["affected"] += getattr(result, "pts_count", 0)
+            out.print(f"\nDeleted entire conversation with user '{display_name}'.\n")
         else:
-            for name, media_filter in self.__media_filters.items():
-                print(f"  Fetching {name}...")
-                messages = await self.get_messages(
+            out.header(f"Deleting messages from '{display_name}'...")
+            if not (
+                self._can_delete_participant_history(entity)
+                and await self._delete_participant_history(entity, display_name, out)
+            ):
+                await self._erase_entity(entity, offset_date, display_name, out)
+
+        self.__state.mark_finished(get_peer_id(entity))
+        self.flush_session()
+        self.__totals["entities"] += 1
+
+    def _can_delete_participant_history(self, entity: hints.Entity) -> bool:
+        """
+        Tells whether all own messages of the entity can go at once: it's a supergroup
+        where we may delete messages of others and no filter limits what is deleted
+        """
+        if not (isinstance(entity, Channel) and (entity.megagroup or entity.gigagroup)):
+            return False
+        rules = self.__entity_rules.get(get_peer_id(entity))
+        if rules is not None and Rule(None, None, None) not in rules:
+            return False
+        # Messages deleted at once can't be archived first
+        if self.__archive is not None:
+            return False
+        if self.__media_filters is not None or (
+            self.__older_than is not None or self.__newer_than is not None
+        ):
+            return False
+        rights = entity.admin_rights
+        return bool(entity.creator or (rights and rights.delete_messages))
+
+    async def _delete_participant_history(
+        self, entity: hints.Entity, display_name: str, out: EntityOutput
+    ) -> bool:
+        """
+        Deletes all own messages of a supergroup with channels.deleteParticipantHistory
+        without scanning them, repeating the request until nothing is left.
+        Returns False if the admin rights turn out to be missing.
+        """
+        request = channels.DeleteParticipantHistoryRequest(
+            get_input_channel(entity), InputPeerSelf()
+        )
+        deleted = 0
+        try:
+            while True:
+                result = await self(request)
+                deleted += result.pts_count
+                if result.offset <= 0:
+                    break
+        except ChatAdminRequiredError:
+            out.print("  Admin rights are missing, scanning own messages instead.")
+            return False
+
+        metrics = self.__metrics.entity(get_peer_id(entity), display_name)
+        metrics["requested"] += deleted
+        metrics["affected"] += deleted
+        self.__totals["found"] += deleted
+        self.__totals["requested"] += deleted
+        out.print(
+            f"\nDeleted all own messages ({deleted}) in '{display_name}' entity "
+            "at once using admin rights.\n"
+        )
+        return True
+
+    async def _pipe(
+        self,
+        scanner: Coroutine[Any, Any, None],
+        queue: "asyncio.Queue[Any]",
+        deleter: Coroutine[Any, Any, T],
+    ) -> T:
+        """
+        Runs a scanner filling the queue concurrently with a deleter draining it.
+        If the deleter fails, the scanner is cancelled; scanner errors are raised
+        after the deleter has drained the stream.
+        """
+        scanner_task = asyncio.create_task(scanner)
+        try:
+            result = await deleter
+        except BaseException:
+            scanner_task.cancel()
+            while not queue.empty():
+                queue.get_nowait()
+            raise
+        await scanner_task
+        return result
+
+    async def _erase_entity(
+        self,
+        entity: hints.Entity,
+        offset_date: datetime | None,
+        display_name: str,
+        out: EntityOutput,
+    ) -> None:
+        """
+        Streams own messages of the entity into a bounded queue of id batches
+        and deletes every batch as soon as it is complete.
+        """
+        queue: asyncio.Queue[Batch | None] = asyncio.Queue(maxsize=self.PENDING_BATCHES)
+        counts = {"scanned": 0, "regular": 0, "service": 0}
+        metrics = self.__metrics.entity(get_peer_id(entity), display_name)
+        try:
+            requested = await self._pipe(
+                self._scan_messages(entity, offset_date, queue, counts, out),
+                queue,
+                self._delete_batches(entity, queue, metrics),
+            )
+        finally:
+            metrics["scanned"] += counts["scanned"]
+        self._trace_memory(f"delete '{display_name}'")
+
+        found = counts["regular"] + counts["service"]
+        self.__totals["found"] += found
+        self.__totals["requested"] += requested
+        if not found:
+            out.print("\nNothing to delete.")
+            return
+
+        out.print(
+            f"\nFound {found} messages "
+            f"({counts['regular']} regular, {counts['service']} service)."
+        )
+        out.print(
+            f"Requested deletion of {requested} messages "
+            f"in '{display_name}' entity, {metrics['affected']} deleted."
+        )
+        if metrics["undeletable"]:
+            out.print(
+                f"{metrics['undeletable']} messages can't be deleted: "
+                f"{self._format_ids(metrics)}"
+            )
+        out.print()
+
+    async def _plan_scans(
+        self, entity: hints.Entity, offset_date: datetime | None, out: EntityOutput
+    ) -> List[Scan]:
+        """
+        Returns the scans of an entity. Without media types it's a single
+        unfiltered scan. With several media types, per-filter counts are
+        requested first and either a filtered search per media type or one pass
+        over all own messages classified on the client is chosen, whichever
+        needs fewer requests.
+        """
+        rules = self.__entity_rules.get(get_peer_id(entity))
+        if rules is not None:
+            return [self._policy_scan(rules)]
+        if self.__media_filters is None:
+            return [Scan("all", None, None)]
+
+        filtered = [Scan(name, f, None) for name, f in self.__media_filters.items()]
+        if len(filtered) == 1:
+            return filtered
+
+        entity_id = get_peer_id(entity)
+        media_pass = Scan(
+            f"pass:{','.join(self.__media_filters)}",
+            None,
+            frozenset(self.__media_filters),
+        )
+        totals = await gather_or_cancel(
+            *(
+                self._count_own_messages(entity, offset_date, scan, entity_id)
+                for scan in [media_pass, *filtered]
+            )
+        )
+        pass_requests = self._pages(totals[0])
+        filtered_requests = sum(self._pages(total) for total in totals[1:])
+        if filtered_requests <= pass_requests:
+            out.print(
+                f"  Plan: {len(filtered)} concurrent filtered searches "
+                f"(~{filtered_requests} requests, "
+                f"one pass would take ~{pass_requests})."
+            )
+            return filtered
+        out.print(
+            f"  Plan: one pass over {totals[0]} own messages classified locally "
+            f"(~{pass_requests} requests, "
+            f"filtered searches would take ~{filtered_requests})."
+        )
+        return [media_pass]
+
+    async def _count_own_messages(
+        self,
+        entity: hints.Entity,
+        offset_date: datetime | None,
+        scan: Scan,
+        entity_id: int,
+    ) -> int:
+        """
+        Returns the number of own messages a scan would fetch (one count-only search,
+        and another one for the messages before the start of a date window)
+        """
+        dates = [offset_date]
+        if self.__min_date is not None:
+            dates.append(self.__min_date)
+        totals = await gather_or_cancel(
+            *(
+                self.__scanner.get_messages(
                     entity,
+                    limit=0,
                     from_user=InputUserSelf(),
-                    limit=None,
-                    wait_time=None,
-                    offset_date=offset_date,
-                    filter=media_filter,
+                    offset_date=date,
+                    min_id=self._min_id(entity_id, scan.name),
+                    filter=scan.media_filter,
                 )
-                for msg in messages:
-                    seen[msg.id] = msg.action is not None
+                for date in dates
+            )
+        )
+        return max(int(totals[0].total) - sum(int(t.total) for t in totals[1:]), 0)
 
-        if not seen:
-            print("\nNothing to delete.")
-            return []
+    def _pages(self, total: int) -> int:
+        """
+        Returns the number of requests needed to fetch `total` messages
+        """
+        return -(-total // self.DELETE_BATCH_SIZE)
 
-        service = sum(seen.values())
-        print(
-            f"\nFound {len(seen)} messages "
-            f"({len(seen) - service} regular, {service} service)."
+    def _min_id(self, entity_id: int, scan: str) -> int:
+        """
+        Returns the high-water mark of the scan in incremental mode, otherwise 0
+        """
+        if not self.__incremental:
+            return 0
+        return self.__state.high_water_mark(entity_id, scan)
+
+    async def _scan_messages(
+        self,
+        entity: hints.Entity,
+        offset_date: datetime | None,
+        queue: "asyncio.Queue[Batch | None]",
+        counts: dict[str, int],
+        out: EntityOutput,
+    ) -> None:
+        """
+        Runs the planned scans of the entity concurrently, all of them feeding
+        the same delete stream. Messages matched by several scans are deleted once.
+        The stream always finishes with None.
+        """
+        entity_id = get_peer_id(entity)
+        seen: MessageIdSet | None = None
+        try:
+            scans = await self._plan_scans(entity, offset_date, out)
+            if len(scans) > 1:
+                seen = MessageIdSet()
+            await gather_or_cancel(
+                *(
+                    self._run_sharded_scan(
+                        entity, entity_id, scan, offset_date, queue, counts, seen, out
+                    )
+                    for scan in scans
+                )
+            )
+            self._trace_memory(f"scan '{get_display_name(entity)}'")
+        finally:
+            if seen is not None:
+                seen.close()
+            await queue.put(None)
+
+    async def _run_sharded_scan(
+        self,
+        entity: hints.Entity,
+        entity_id: int,
+        scan: Scan,
+        offset_date: datetime | None,
+        queue: "asyncio.Queue[Batch | None]",
+        counts: dict[str, int],
+        seen: MessageIdSet | None,
+        out: EntityOutput,
+    ) -> None:
+        """
+        Splits the ID range of the scan into up to `scan_workers` shards scanned
+        concurrently, all of them feeding the delete stream. Every shard has its
+        own checkpoint; the scan is done once all of them are.
+        """
+        shards = []
+        if self.__scan_workers > 1:
+            if self.__state.scan_progress(entity_id, scan.name)[1]:
+                return
+            shards = await self._shard_scan(entity, entity_id, scan, offset_date)
+        if len(shards) < 2:
+            await self._run_scan(
+                entity, entity_id, scan, offset_date, queue, counts, seen, out
+            )
+            return
+
+        out.print(
+            f"  Fetching {scan.name} in {len(shards)} shards "
+            f"of ~{shards[0].max_id - shards[0].min_id} IDs..."
         )
-        if service > 0 and not isinstance(entity, User):
-            print(
-                "Note: service messages may not delete without admin rights; "
-                "Telegram silently skips unauthorized deletions."
+        await gather_or_cancel(
+            *(
+                self._run_scan(
+                    entity, entity_id, shard, offset_date, queue, counts, seen, out
+                )
+                for shard in shards
+            )
+        )
+        await queue.put((scan.name, [], None))
+
+    async def _shard_scan(
+        self,
+        entity: hints.Entity,
+        entity_id: int,
+        scan: Scan,
+        offset_date: datetime | None,
+    ) -> List[Scan]:
+        """
+        Splits the ID range of the scan into equal shards. The range ends at
+        the newest message before `offset_date` and starts at the high-water
+        mark of the scan or at the start of the date window. Shard names contain
+        their bounds, so an interrupted run only continues the shards of the
+        same range.
+        """
+        newest = await self.__scanner.get_messages(
+            entity, limit=1, offset_date=offset_date
+        )
+        if not newest:
+            return []
+        top = newest[0].id
+        bottom = self._min_id(entity_id, scan.name)
+        if self.__min_date is not None:
+            oldest = await self.__scanner.get_messages(
+                entity, limit=1, offset_date=self.__min_date
             )
-        return list(seen)
+            bottom = max(bottom, oldest[0].id if oldest else 0)
 
-    async def _delete_messages(
-        self, entity: hints.Entity, messages_to_delete: List[int], display_name: str
+        count = min(self.__scan_workers, (top - bottom) // self.MIN_SHARD_IDS)
+        if count < 2:
+            return []
+        bounds = [bottom + (top - bottom) * i // count for i in range(count + 1)]
+        return [
+            scan._replace(
+                name=f"{scan.name}{self.SHARD_SEPARATOR}{low}-{high}",
+                min_id=low,
+                max_id=high + 1,
+            )
+            for low, high in zip(bounds, bounds[1:])
+        ]
+
+    async def _run_scan(
+        self,
+        entity: hints.Entity,
+        entity_id: int,
+        scan: Scan,
+        offset_date: datetime | None,
+        queue: "asyncio.Queue[Batch | None]",
+        counts: dict[str, int],
+        seen: MessageIdSet | None,
+        out: EntityOutput,
     ) -> None:
         """
-        Deletes messages.
+        Puts batches of own message IDs into the queue while pages arrive.
+        A scan done by an interrupted run is skipped and the one in progress
+        continues from its checkpoint. Incremental scans only fetch messages
+        above the high-water mark of the previous run. With a date window the scan
+        starts at its end and stops at the first message before its start.
+        An empty batch ends the scan.
         """
-        print_header(f"Deleting messages from '{display_name}'...")
-        await self.delete_messages(entity, messages_to_delete, revoke=True)
-        print(
-            f"\nRequested deletion of {len(messages_to_delete)} messages "
-            f"in '{display_name}' entity.\n"
+        offset_id, done = self.__state.scan_progress(entity_id, scan.name)
+        if done:
+            return
+        # The checkpoint of a shard is always below its end
+        offset_id = offset_id or scan.max_id
+        if scan.media_filter is not None and not scan.max_id:
+            out.print(f"  Fetching {scan.name}...")
+        min_id = max(self._min_id(entity_id, scan.name), scan.min_id)
+        if min_id and not scan.max_id:
+            out.print(f"  Fetching messages after #{min_id}...")
+        min_date = self.__min_date
+        if scan.rules is not None:
+            afters = [rule.after for rule in scan.rules]
+            min_date = None if None in afters else min(afters)
+
+        batch: List[Message] = []
+        async for msg in self._iter_own_messages(
+            entity, offset_date, offset_id, min_id, scan.media_filter
+        ):
+            # Telethon doesn't pass min_date to the server, but messages come
+            # newest first, so everything after this one is out of the window too
+            if min_date is not None and msg.date < min_date:
+                break
+            counts["scanned"] += 1
+            if scan.media_types is not None and (
+                self._media_type(msg) not in scan.media_types
+            ):
+                continue
+            if scan.rules is not None and not self._matches_rules(msg, scan.rules):
+                continue
+            if seen is not None and not seen.add(msg.id):
+                continue
+            counts["service" if msg.action is not None else "regular"] += 1
+            batch.append(msg)
+            if len(batch) >= self.DELETE_BATCH_SIZE:
+                await self._put_batch(queue, entity_id, scan.name, batch)
+                batch = []
+        if batch:
+            await self._put_batch(queue, entity_id, scan.name, batch)
+        await queue.put((scan.name, [], None))
+
+    @staticmethod
+    def _media_type(msg: Message) -> str | None:
+        """
+        Classifies a message like the server-side media filters do. Only the
+        media of the message itself count: Telethon's `photo` and `document`
+        properties also return photos of link previews and service messages.
+        """
+        media = getattr(msg, "media", None)
+        if isinstance(media, MessageMediaPhoto):
+            return "photo" if media.photo else None
+        if not isinstance(media, MessageMediaDocument) or media.document is None:
+            return None
+        attributes = {type(a): a for a in getattr(media.document, "attributes", [])}
+        video = attributes.get(DocumentAttributeVideo)
+        audio = attributes.get(DocumentAttributeAudio)
+        if video is not None and video.round_message:
+            return "video_note"
+        if DocumentAttributeAnimated in attributes:
+            return "gif"
+        if video is not None:
+            return "video"
+        if audio is not None:
+            return "voice" if audio.voice else "audio"
+        if DocumentAttributeSticker in attributes:
+            return None
+        return "document"
+
+    async def _put_batch(
+        self,
+        queue: "asyncio.Queue[Batch | None]",
+        entity_id: int,
+        scan: str,
+        batch: List[Message],
+    ) -> None:
+        """
+        Puts a batch into the delete stream and records the scan position.
+        With an archive the batch is archived first, and the deleter waits
+        for its archive writes before deleting it.
+        """
+        ids = [msg.id for msg in batch]
+        archived = None
+        if self.__archive is not None:
+            archived = await self.__archive.add(self.__scanner, entity_id, batch)
+        await queue.put((scan, ids, archived))
+        self.__state.save_scanned(entity_id, scan, ids)
+
+    def _iter_own_messages(
+        self,
+        entity: hints.Entity,
+        offset_date: datetime | None,
+        offset_id: int,
+        min_id: int,
+        media_filter: TypeMessagesFilter | None,
+    ) -> AsyncIterator[Message]:
+        """
+        Iterates own messages page by page without materializing the history
+        """
+        return self.__scanner.iter_messages(
+            entity,
+            from_user=InputUserSelf(),
+            wait_time=0,
+            offset_date=offset_date,
+            offset_id=offset_id,
+            min_id=min_id,
+            filter=media_filter,
         )
 
+    async def _delete_batches(
+        self,
+        entity: hints.Entity,
+        queue: "asyncio.Queue[Batch | None]",
+        metrics: dict[str, Any],
+    ) -> int:
+        """
+        Deletes batches from the queue until the stream ends, checkpointing each one
+        and counting the requested and actually deleted messages in `metrics`.
+        Returns the number of messages requested for deletion.
+        """
+        entity_id = get_peer_id(entity)
+        requested = 0
+        while (item := await queue.get()) is not None:
+            scan, batch, archived = item
+            if not batch:
+                # Messages before a date window aren't dealt with, so such a scan
+                # can't be a high-water mark for later runs; nor can a single shard
+                # or a policy scan, whose rules may keep older messages for now
+                self.__state.mark_scan_done(
+                    entity_id,
+                    scan,
+                    high_water_mark=self.__newer_than is None
+                    and self.SHARD_SEPARATOR not in scan
+                    and scan != self.POLICY_SCAN,
+                )
+                continue
+            if archived is not None:
+                await archived
+            await self._delete_verified(entity, batch, metrics)
+            self.__state.save_deleted(entity_id, scan, min(batch))
+            requested += len(batch)
+        return requested
+
+    async def _delete_verified(
+        self, entity: hints.EntityLike, batch: List[int], metrics: dict[str, Any]
+    ) -> int:
+        """
+        Deletes a batch and makes sure it's gone. Telegram silently skips
+        messages it won't delete, so if fewer messages are affected than
+        requested, the batch is looked up by IDs and the messages still there
+        are requested again, up to DELETE_RETRIES times. Service messages that
+        survive aren't retried: they need admin rights. Counts the batch in
+        `metrics`, records the messages that can't be deleted there and returns
+        the number of deleted messages.
+        """
+        metrics["requested"] += len(batch)
+        deleted = 0
+        undeletable: List[int] = []
+        for attempt in range(self.DELETE_RETRIES + 1):
+            results = await self.delete_messages(entity, batch, revoke=True)
+            affected = sum(r.pts_count for r in results)
+            deleted += affected
+            if affected >= len(batch):
+                break
+            survivors = [
+                msg
+                for msg in await self.__scanner.get_messages(entity, ids=batch)
+                if msg is not None
+            ]
+            # Skipped IDs that are gone anyway were deleted by someone else
+            batch = []
+            for msg in survivors:
+                if msg.action is not None or attempt == self.DELETE_RETRIES:
+                    undeletable.append(msg.id)
+                else:
+                    batch.append(msg.id)
+            if not batch:
+                break
+        metrics["affected"] += deleted
+        metrics["undeletable"] += len(undeletable)
+        metrics["undeletable_ids"].extend(undeletable)
+        self.__totals["undeletable"] += len(undeletable)
+        return deleted
+
+    def _format_ids(self, metrics: dict[str, Any]) -> str:
+        """
+        Lists the IDs of the messages of an entity that can't be deleted
+        """
+        ids = sorted(metrics["undeletable_ids"])
+        shown = ", ".join(str(i) for i in ids[: self.SHOWN_IDS])
+        if len(ids) > self.SHOWN_IDS:
+            shown += f" and {len(ids) - self.SHOWN_IDS} more"
+        return shown
+
+    async def _get_dialog_entities(self) -> List[hints.Entity]:
+        """
+        Returns entities of the dialog list from the cached snapshot
+        unless it has expired or a refresh is requested
+        """
+        if not self.__refresh_dialogs:
+            cached = self.__state.load_dialogs(self.__dialogs_ttl, self.__limit)
+            if cached is not None:
+                age = int(self.__state.dialogs_age() or 0)
+                print(
+                    f"Using dialog list cached {age}s ago "
+                    "(--refresh-dialogs to fetch it again)."
+                )
+                entities = [BinaryReader(data).tgread_object() for data in cached]
+                self._trace_memory("dialogs")
+                return entities
+
+        entities = [d.entity for d in await self.get_dialogs(limit=self.__limit)]
+        self.__state.save_dialogs([bytes(entity) for entity in entities], self.__limit)
+        self._trace_memory("dialogs")
+        return entities
+
     async def _filter_entities(self) -> List[hints.EntityLike]:
         """
         Returns requested filtered entities
         """
-        entities = [d.entity for d in await self.get_dialogs(limit=self.__limit)]
-        entity_filters = {
-            "any": lambda e: True,
-            "user": lambda e: isinstance(e, User) and not e.is_self,
-            "chat": lambda e: isinstance(e, Chat)
-            or (isinstance(e, Channel) and (e.megagroup or e.gigagroup)),
-            "channel": lambda e: isinstance(e, Channel) and not e.megagroup,
-        }
-        if self.__entity_type not in entity_filters:
+        entities = await self._get_dialog_entities()
+        if self.__entity_type not in self.ENTITY_FILTERS:
             raise TgEraserException(
                 f"Error: wrong entity type: '{self.__entity_type}'. Use 'any', 'user', 'chat' or 'channel'."
             )
-        return [
-            entity for entity in entities if entity_filters[self.__entity_type](entity)
-        ]
+        entity_filter = self.ENTITY_FILTERS[self.__entity_type]
+        return [entity for entity in entities if entity_filter(entity)]
 
     async def _get_user_selected_entity(self) -> None:
         """
@@ -0,0 +1,119 @@
+"""
+Compact set of message IDs for deduplication across scans
+"""
+
+import heapq
+import mmap
+import tempfile
+from array import array
+from bisect import bisect_left
+from typing import IO, Any, List, Sequence
+
+
+class MessageIdSet:
+    """
+    Set of message IDs stored as sorted runs of 64-bit integers (8 bytes per ID
+    instead of ~60 for a set of ints). New IDs are collected in a small buffer
+    that becomes a sorted run when full; runs of similar size are merged, so
+    there are only O(log n) of them. Once the runs take more than `max_memory`
+    bytes they are merged into one and spilled to a temporary file, which is
+    searched through mmap.
+    """
+
+    BUFFER_SIZE = 16384
+
+    def __init__(self, max_memory: int = 64 * 2**20) -> None:
+        self.__max_items = max(max_memory // 8, self.BUFFER_SIZE)
+        self.__buffer: set[int] = set()
+        self.__runs: List[array] = []
+        self.__file: IO[bytes] | None = None
+        self.__mmap: mmap.mmap | None = None
+        self.__view: memoryview | None = None
+        self.__spilled: List[tuple[int, int]] = []  # (start, length) in the file
+        self.__len = 0
+
+    def __enter__(self) -> "MessageIdSet":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def __contains__(self, message_id: int) -> bool:
+        if message_id in self.__buffer:
+            return True
+        if any(self._search(run, message_id) for run in self.__runs):
+            return True
+        if self.__view is not None:
+            return any(
+                self._search(self.__view[start : start + length], message_id)
+                for start, length in self.__spilled
+            )
+        return False
+
+    def add(self, message_id: int) -> bool:
+        """
+        Adds an ID. Returns False if it was already in the set.
+        """
+        if message_id in self:
+            return False
+        self.__buffer.add(message_id)
+        self.__len += 1
+        if len(self.__buffer) >= self.BUFFER_SIZE:
+            self.__flush_buffer()
+        return True
+
+    def close(self) -> None:
+        """
+        Frees the memory and removes the temporary file
+        """
+        self.__buffer.clear()
+        self.__runs.clear()
+        self.__spilled.clear()
+        if self.__view is not None:
+            self.__view.release()
+            self.__view = None
+        if self.__mmap is not None:
+            self.__mmap.close()
+            self.__mmap = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.__len = 0
+
+    @staticmethod
+    def _search(run: Sequence[int], message_id: int) -> bool:
+        if not run or message_id < run[0] or message_id > run[-1]:
+            return False
+        i = bisect_left(run, message_id)
+        return i < len(run) and run[i] == message_id
+
+    def __flush_buffer(self) -> None:
+        self.__runs.append(array("q", sorted(self.__buffer)))
+        self.__buffer.clear()
+        # Merge like a binary counter: a run is never followed by a bigger one
+        while len(self.__runs) > 1 and len(self.__runs[-2]) <= len(self.__runs[-1]):
+            last = self.__runs.pop()
+            self.__runs[-1] = array("q", heapq.merge(self.__runs[-1], last))
+        if sum(len(run) for run in self.__runs) > self.__max_items:
+            self.__spill()
+
+    def __spill(self) -> None:
+        merged = array("q", heapq.merge(*self.__runs))
+        self.__runs.clear()
+        if self.__file is None:
+            self.__file = tempfile.TemporaryFile()
+        self.__file.seek(0, 2)
+        start = self.__file.tell() // merged.itemsize
+        merged.tofile(self.__file)
+        self.__file.flush()
+        self.__spilled.append((start, len(merged)))
+
+        if self.__view is not None:
+            self.__view.release()
+        if self.__mmap is not None:
+            self.__mmap.close()
+        self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__mmap).cast("q")
@@ -0,0 +1,253 @@
+"""
+Metrics of a run, exported as JSON and as a Prometheus textfile
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, List
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, like Prometheus histograms
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(self.BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Records a value
+        """
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns cumulative counts per upper bound, the sum and the count
+        """
+        buckets = {str(bound): n for bound, n in zip(self.BUCKETS, self.counts)}
+        buckets["+Inf"] = self.count
+        return {"buckets": buckets, "sum": round(self.sum, 6), "count": self.count}
+
+
+class RunMetrics:
+    """
+    Counters of a single run: requests, latency and payload sizes per method,
+    FloodWait seconds per request class and messages per entity.
+    Payload sizes are those of the serialized requests and results (without
+    MTProto framing) and are only measured if `measure_bytes` is set,
+    since serializing every result costs CPU time.
+    """
+
+    def __init__(self, session: str, measure_bytes: bool = False) -> None:
+        self.session = session
+        self.__measure_bytes = measure_bytes
+        self.__started = time.time()
+        self.__finished: float | None = None
+        self.__rpc: dict[str, dict[str, Any]] = {}
+        self.__flood_wait_seconds: dict[str, int] = {}
+        self.__entities: dict[int, dict[str, Any]] = {}
+        self.__bytes = {"sent": 0, "received": 0}
+
+    def start(self) -> None:
+        """
+        Starts a new run, forgetting the messages of the previous one
+        """
+        self.__started = time.time()
+        self.__finished = None
+        self.__entities.clear()
+
+    def finish(self) -> None:
+        """
+        Records the end of the run
+        """
+        self.__finished = time.time()
+
+    def observe_rpc(
+        self,
+        name: str,
+        seconds: float,
+        request: Any,
+        result: Any = None,
+        failed: bool = False,
+    ) -> None:
+        """
+        Records a request (or a list of requests) sent with method `name`
+        """
+        method = self.__rpc.setdefault(
+            name, {"count": 0, "errors": 0, "latency": Histogram()}
+        )
+        method["count"] += len(request) if isinstance(request, list) else 1
+        method["errors"] += failed
+        method["latency"].observe(seconds)
+        if self.__measure_bytes:
+            self.__bytes["sent"] += self._size(request)
+            self.__bytes["received"] += self._size(result)
+
+    def observe_flood_wait(self, request_class: str, seconds: int) -> None:
+        """
+        Records seconds slept because of a FloodWait
+        """
+        self.__flood_wait_seconds[request_class] = (
+            self.__flood_wait_seconds.get(request_class, 0) + seconds
+        )
+
+    def entity(self, entity_id: int, name: str) -> dict[str, Any]:
+        """
+        Returns the message counters of an entity
+        """
+        return self.__entities.setdefault(
+            entity_id,
+            {
+                "id": entity_id,
+                "name": name,
+                "scanned": 0,
+                "requested": 0,
+                "affected": 0,
+                "undeletable": 0,
+                "undeletable_ids": [],
+            },
+        )
+
+    @staticmethod
+    def _size(obj: Any) -> int:
+        """
+        Returns the serialized size of a TL object or a list of them
+        """
+        if obj is None:
+            return 0
+        if isinstance(obj, list):
+            return sum(RunMetrics._size(item) for item in obj)
+        try:
+            return len(bytes(obj))
+        except Exception:  # pylint: disable=broad-except
+            return 0
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the metrics as a JSON-serializable dict
+        """
+        finished = self.__finished or time.time()
+        entities = list(self.__entities.values())
+        return {
+            "session": self.session,
+            "started": _isoformat(self.__started),
+            "finished": _isoformat(finished),
+            "duration_seconds": round(finished - self.__started, 3),
+            "entities": len(entities),
+            "messages": {
+                key: sum(e[key] for e in entities)
+                for key in ("scanned", "requested", "affected", "undeletable")
+            },
+            "flood_wait_seconds": dict(self.__flood_wait_seconds),
+            "bytes": dict(self.__bytes),
+            "rpc": {
+                name: {**method, "latency": method["latency"].to_dict()}
+                for name, method in sorted(self.__rpc.items())
+            },
+            "per_entity": entities,
+        }
+
+
+def write_json(path: str, runs: List[dict[str, Any]]) -> None:
+    """
+    Writes metrics of a run, or of several runs as a list, to a JSON file
+    """
+    with open(path, "w") as file:
+        json.dump(runs[0] if len(runs) == 1 else runs, file, indent=2)
+
+
+def write_prometheus(path: str, runs: List[dict[str, Any]]) -> None:
+    """
+    Writes metrics of runs in the Prometheus text format for the node-exporter
+    textfile collector. The file is replaced atomically, so the collector
+    never reads a partial file.
+    """
+    families: dict[str, tuple[str, str, List[str]]] = {}
+
+    def add(
+        family: str, kind: str, help_text: str, labels: dict[str, Any], value: Any
+    ) -> None:
+        name, _, suffix = family.partition(":")
+        samples = families.setdefault(name, (kind, help_text, []))[2]
+        label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        samples.append(f"{name}{suffix}{{{label_str}}} {value}")
+
+    for run in runs:
+        session = {"session": run["session"]}
+        finished = datetime.fromisoformat(run["finished"]).timestamp()
+        for family, help_text, value in [
+            ("timestamp_seconds", "End time of the last run.", round(finished, 3)),
+            ("duration_seconds", "Duration of the last run.", run["duration_seconds"]),
+            ("entities", "Entities processed by the last run.", run["entities"]),
+            *(
+                (f"messages_{key}", f"Messages {key} by the last run.", value)
+                for key, value in run["messages"].items()
+            ),
+            *(
+                (f"bytes_{key}", f"Payload bytes {key} by the last run.", value)
+                for key, value in run["bytes"].items()
+            ),
+        ]:
+            add(f"tgeraser_last_run_{family}", "gauge", help_text, session, value)
+        for request_class, seconds in run["flood_wait_seconds"].items():
+            add(
+                "tgeraser_last_run_flood_wait_seconds",
+                "gauge",
+                "FloodWait seconds slept by the last run.",
+                {**session, "class": request_class},
+                seconds,
+            )
+        for method, stats in run["rpc"].items():
+            labels = {**session, "method": method}
+            add(
+                "tgeraser_last_run_requests",
+                "gauge",
+                "Requests sent by the last run.",
+                labels,
+                stats["count"],
+            )
+            add(
+                "tgeraser_last_run_request_errors",
+                "gauge",
+                "Failed requests of the last run.",
+                labels,
+                stats["errors"],
+            )
+            latency = stats["latency"]
+            family = "tgeraser_last_run_request_duration_seconds"
+            help_text = "Request latency of the last run."
+            for bound, count in latency["buckets"].items():
+                bucket_labels = {**labels, "le": bound}
+                add(f"{family}:_bucket", "histogram", help_text, bucket_labels, count)
+            add(f"{family}:_sum", "histogram", help_text, labels, latency["sum"])
+            add(f"{family}:_count", "histogram", help_text, labels, latency["count"])
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
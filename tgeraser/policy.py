@@ -0,0 +1,105 @@
+"""
+Retention policy: rules read from a TOML or JSON file
+"""
+
+import json
+from typing import Any, List, NamedTuple
+
+from .exceptions import TgEraserException
+from .utils import parse_time_period
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None  # type: ignore[assignment]
+
+RULE_KEYS = {"peers", "entity_type", "older_than", "newer_than", "media_types"}
+ENTITY_TYPES = ("any", "user", "chat", "channel")
+
+
+class PolicyRule(NamedTuple):
+    """
+    A rule of a policy: own messages of some peers or of all dialogs of an
+    entity type, optionally only the ones older or newer than some seconds
+    and of some media types
+    """
+
+    peers: tuple[str, ...]
+    entity_type: str | None
+    older_than: int | None
+    newer_than: int | None
+    media_types: str | None
+
+
+def load_policy(path: str) -> List[PolicyRule]:
+    """
+    Reads the rules of a policy file. A TOML file has a [[rules]] table per rule,
+    a JSON file has a "rules" list of objects with the same keys:
+    peers (a list or a comma-separated string) or entity_type, and optionally
+    older_than, newer_than and media_types as for the command line options.
+    """
+    try:
+        if path.endswith(".toml"):
+            if tomllib is None:
+                raise TgEraserException(
+                    "Error: TOML policies need Python 3.11 or newer, use JSON instead."
+                )
+            with open(path, "rb") as file:
+                policy = tomllib.load(file)
+        else:
+            with open(path, "r") as file:
+                policy = json.load(file)
+    except OSError as err:
+        raise TgEraserException(f"Error: can't read policy file: {err}") from err
+    except ValueError as err:  # Both decode errors are ValueErrors
+        raise TgEraserException(f"Error: invalid policy file: {err}") from err
+
+    rules = policy.get("rules") if isinstance(policy, dict) else None
+    if not rules or not isinstance(rules, list):
+        raise TgEraserException("Error: the policy file has no rules.")
+    return [_parse_rule(rule, i) for i, rule in enumerate(rules, start=1)]
+
+
+def _parse_rule(rule: Any, number: int) -> PolicyRule:
+    name = f"policy rule {number}"
+    if not isinstance(rule, dict):
+        raise TgEraserException(f"Error: {name} should be a table of options.")
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise TgEraserException(
+            f"Error: unknown keys in {name}: {', '.join(sorted(unknown))}"
+        )
+    if ("peers" in rule) == ("entity_type" in rule):
+        raise TgEraserException(f"Error: {name} needs either peers or entity_type.")
+
+    peers = rule.get("peers", ())
+    if isinstance(peers, str):
+        peers = peers.split(",")
+    older_than = newer_than = None
+    if "older_than" in rule:
+        older_than = parse_time_period(str(rule["older_than"]), name)["time"]
+    if "newer_than" in rule:
+        newer_than = parse_time_period(str(rule["newer_than"]), name)["time"]
+    if older_than is not None and newer_than is not None and newer_than <= older_than:
+        raise TgEraserException(f"Error: the date window of {name} is empty.")
+    media_types = rule.get("media_types")
+    if isinstance(media_types, list):
+        media_types = ",".join(media_types)
+
+    peers = tuple(str(peer).strip() for peer in peers if str(peer).strip())
+    if "peers" in rule and not peers:
+        raise TgEraserException(f"Error: {name} has no peers.")
+    entity_type = rule.get("entity_type")
+    if entity_type is not None and entity_type not in ENTITY_TYPES:
+        raise TgEraserException(
+            f"Error: wrong entity type in {name}: '{entity_type}'. "
+            f"Use {', '.join(repr(t) for t in ENTITY_TYPES)}."
+        )
+
+    return PolicyRule(
+        peers=peers,
+        entity_type=entity_type,
+        older_than=older_than,
+        newer_than=newer_than,
+        media_types=media_types,
+    )
@@ -0,0 +1,122 @@
+"""
+Profiling of a run: a cProfile dump and tracemalloc snapshots per phase
+"""
+
+import cProfile
+import tracemalloc
+from typing import Any, List
+
+from .utils import print_header, sprint
+
+MB = 2**20
+
+
+class Profiler:
+    """
+    Profiles everything run between start() and stop() with cProfile
+    and dumps the stats to a file readable by pstats
+    """
+
+    def __init__(self, path: str) -> None:
+        self.__path = path
+        self.__profile = cProfile.Profile()
+        self.__running = False
+
+    def start(self) -> None:
+        """
+        Starts profiling
+        """
+        self.__running = True
+        self.__profile.enable()
+
+    def stop(self) -> None:
+        """
+        Stops profiling and writes the stats (only once)
+        """
+        if not self.__running:
+            return
+        self.__running = False
+        self.__profile.disable()
+        self.__profile.dump_stats(self.__path)
+        sprint(
+            f"Profile saved to '{self.__path}' file "
+            f"(view it with: python -m pstats {self.__path})."
+        )
+
+
+class MemoryTracer:
+    """
+    Takes tracemalloc snapshots at phases of a run (dialog fetch, scan and delete
+    of every entity) and reports memory per phase and the top allocators of the
+    phase with the most memory in use, by source line and by package.
+    Only one snapshot is kept at a time, so tracing doesn't hoard memory itself.
+    """
+
+    NFRAMES = 1
+    TOP = 15
+    PACKAGES = ("telethon/tl", "telethon", "tgeraser", "sqlite3", "asyncio")
+
+    def __init__(self) -> None:
+        self.__phases: List[tuple[str, int, int]] = []
+        self.__largest: tuple[str, int, Any] | None = None
+
+    def start(self) -> None:
+        """
+        Starts tracing allocations
+        """
+        tracemalloc.start(self.NFRAMES)
+
+    def snapshot(self, phase: str) -> None:
+        """
+        Records memory in use and the peak since the previous phase
+        """
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.__phases.append((phase, current, peak))
+        if self.__largest is None or current > self.__largest[1]:
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                    tracemalloc.Filter(False, "<unknown>"),
+                ]
+            )
+            self.__largest = (phase, current, snapshot)
+
+    def report(self) -> None:
+        """
+        Prints memory per phase and the top allocators, then stops tracing
+        """
+        if not tracemalloc.is_tracing():
+            return
+        if not self.__phases:
+            self.snapshot("end")
+        tracemalloc.stop()
+
+        print_header("Memory by phase")
+        for phase, current, peak in self.__phases:
+            sprint(f"{phase}\t | in use {current / MB:.1f} MB, peak {peak / MB:.1f} MB")
+
+        if self.__largest is None:
+            return
+        phase, _, snapshot = self.__largest
+        print_header(f"Top allocators at '{phase}'")
+        for stat in snapshot.statistics("lineno")[: self.TOP]:
+            frame = stat.traceback[0]
+            sprint(
+                f"{stat.size / MB:8.1f} MB {stat.count:9} blocks  "
+                f"{frame.filename}:{frame.lineno}"
+            )
+
+        by_package: dict[str, int] = {}
+        for stat in snapshot.statistics("filename"):
+            filename = stat.traceback[0].filename.replace("\\", "/")
+            package = next(
+                (p for p in self.PACKAGES if f"/{p}/" in filename), "other"
+            )
+            by_package[package] = by_package.get(package, 0) + stat.size
+        sprint("")
+        for package, size in sorted(by_package.items(), key=lambda i: -i[1]):
+            sprint(f"{size / MB:8.1f} MB  {package}")
@@ -0,0 +1,100 @@
+"""
+Adaptive rate limiting of requests sent to Telegram
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket of a single request class. Its rate is lowered to the
+    throughput observed before a FloodWait and then raised back slowly,
+    but never above the rate that was throttled last time.
+    """
+
+    MIN_RATE = 0.05
+    SAFETY_FACTOR = 0.8
+    INCREASE_STEP = 0.01
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.__max_rate = rate
+        self.__tokens = burst
+        self.__updated = time.monotonic()
+        self.__blocked_until = 0.0
+        self.__window_start = self.__updated
+        self.__window_requests = 0
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Waits until a request of this class may be sent
+        """
+        async with self.__lock:
+            delay = self.__blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.__refill()
+            if self.__tokens < 1:
+                await asyncio.sleep((1 - self.__tokens) / self.rate)
+                self.__refill()
+            self.__tokens -= 1
+            self.__window_requests += 1
+
+    def on_success(self) -> None:
+        """
+        Slowly raises the rate back towards the learned limit
+        """
+        self.rate = min(self.rate + self.INCREASE_STEP, self.__max_rate)
+
+    def on_flood_wait(self, seconds: int) -> None:
+        """
+        Learns the sustainable rate from a FloodWait and blocks the bucket for its duration
+        """
+        now = time.monotonic()
+        # Without requests since the last FloodWait this one hit a request
+        # that was already in flight, so there is nothing new to learn
+        if self.__window_requests:
+            observed = self.__window_requests / (now - self.__window_start + seconds)
+            self.__max_rate = max(observed * self.SAFETY_FACTOR, self.MIN_RATE)
+            self.rate = max(min(self.rate / 2, self.__max_rate), self.MIN_RATE)
+        self.__tokens = 0
+        self.__updated = now
+        self.__blocked_until = max(self.__blocked_until, now + seconds)
+        self.__window_start = now + seconds
+        self.__window_requests = 0
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+
+class RateLimiter:
+    """
+    Keeps a separate token bucket per request class, so a FloodWait
+    only slows down the class of requests that was throttled.
+    """
+
+    DEFAULT_RATES: dict[str, float] = {
+        "history": 10.0,
+        "search": 10.0,
+        "delete": 5.0,
+        "resolve": 1.0,
+        "takeout": 30.0,
+        "other": 30.0,
+    }
+
+    def __init__(self) -> None:
+        self.__buckets: dict[str, TokenBucket] = {}
+
+    def bucket(self, request_class: str) -> TokenBucket:
+        """
+        Returns the bucket of the request class, creating it on first use
+        """
+        if request_class not in self.__buckets:
+            rate = self.DEFAULT_RATES.get(request_class, self.DEFAULT_RATES["other"])
+            self.__buckets[request_class] = TokenBucket(rate, burst=rate)
+        return self.__buckets[request_class]
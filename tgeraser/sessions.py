@@ -0,0 +1,63 @@
+"""
+Storage backends of the Telethon session
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+
+from telethon.sessions import Session, SQLiteSession, StringSession
+
+from .exceptions import TgEraserException
+
+TG_SESSION_STRING = os.environ.get("TG_SESSION_STRING")
+
+SESSION_BACKENDS = ("file", "memory", "string")
+
+
+class MemorySQLiteSession(SQLiteSession):
+    """
+    SQLite session kept in an in-memory database. It's copied from the
+    .session file when opened and written back only by flush(), so entities
+    of every response don't cost synchronous disk I/O on the event loop.
+    """
+
+    def _cursor(self) -> sqlite3.Cursor:
+        if self._conn is None:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            if os.path.exists(self.filename):
+                with closing(sqlite3.connect(self.filename)) as disk:
+                    disk.backup(self._conn)
+        return self._conn.cursor()
+
+    def flush(self) -> None:
+        """
+        Writes the session to the .session file
+        """
+        if self._conn is None:
+            return
+        self._conn.commit()
+        with closing(sqlite3.connect(self.filename)) as disk:
+            self._conn.backup(disk)
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+def open_session(backend: str, session_name: str) -> Session:
+    """
+    Returns the session of a backend: the .session file, its in-memory copy
+    or a string session from the TG_SESSION_STRING environment variable
+    (an empty one if it isn't set)
+    """
+    if backend == "file":
+        return SQLiteSession(session_name)
+    if backend == "memory":
+        return MemorySQLiteSession(session_name)
+    if backend == "string":
+        return StringSession(TG_SESSION_STRING)
+    raise TgEraserException(
+        f"Invalid session backend: '{backend}'. "
+        f"Valid backends are: {', '.join(SESSION_BACKENDS)}"
+    )
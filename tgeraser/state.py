@@ -0,0 +1,290 @@
+"""
+Persistent state of a session, stored next to the session file
+"""
+
+import sqlite3
+import time
+from typing import Any
+
+STATE_EXTENSION = ".state"
+
+
+class StateStore:
+    """
+    SQLite store with the checkpoint of the current run (finished entities
+    and the progress of every scan of the entity in progress) and the
+    high-water marks of completed scans used by incremental runs, a
+    snapshot of the dialog list, the access hashes of resolved peers and the
+    time-ordered index of own messages kept by the daemon.
+    Every change is committed at once, so it survives an abrupt exit.
+    """
+
+    def __init__(self, session_name: str) -> None:
+        self.__conn = sqlite3.connect(session_name + STATE_EXTENSION)
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS finished_entities (
+                entity_id INTEGER PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS scan_progress (
+                entity_id INTEGER NOT NULL,
+                scan TEXT NOT NULL,
+                last_scanned_id INTEGER NOT NULL DEFAULT 0,
+                last_deleted_id INTEGER NOT NULL DEFAULT 0,
+                top_id INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (entity_id, scan)
+            );
+            CREATE TABLE IF NOT EXISTS high_water_marks (
+                entity_id INTEGER NOT NULL,
+                scan TEXT NOT NULL,
+                max_id INTEGER NOT NULL,
+                PRIMARY KEY (entity_id, scan)
+            );
+            CREATE TABLE IF NOT EXISTS dialogs (
+                position INTEGER PRIMARY KEY,
+                entity BLOB NOT NULL
+            );
+            DROP TABLE IF EXISTS peers;
+            CREATE TABLE IF NOT EXISTS peer_hashes (
+                peer TEXT PRIMARY KEY,
+                peer_id INTEGER NOT NULL,
+                access_hash INTEGER NOT NULL,
+                resolved_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS own_messages (
+                entity_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                date INTEGER NOT NULL,
+                PRIMARY KEY (entity_id, message_id)
+            );
+            CREATE INDEX IF NOT EXISTS own_messages_date ON own_messages (date);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value
+            );
+            """
+        )
+
+    def close(self) -> None:
+        """
+        Closes the database
+        """
+        self.__conn.close()
+
+    def reset_checkpoint(self) -> None:
+        """
+        Forgets the checkpoint of the previous run
+        """
+        with self.__conn:
+            self.__conn.execute("DELETE FROM finished_entities")
+            self.__conn.execute("DELETE FROM scan_progress")
+
+    def finished_entities(self) -> set[int]:
+        """
+        Returns IDs of entities finished by the interrupted run
+        """
+        rows = self.__conn.execute("SELECT entity_id FROM finished_entities")
+        return {entity_id for (entity_id,) in rows}
+
+    def mark_finished(self, entity_id: int) -> None:
+        """
+        Marks the entity as finished and drops its scan progress
+        """
+        with self.__conn:
+            self.__conn.execute(
+                "INSERT OR IGNORE INTO finished_entities VALUES (?)", (entity_id,)
+            )
+            self.__conn.execute(
+                "DELETE FROM scan_progress WHERE entity_id = ?", (entity_id,)
+            )
+
+    def scan_progress(self, entity_id: int, scan: str) -> tuple[int, bool]:
+        """
+        Returns the ID below which the scan has to continue (0 for the start)
+        and whether the scan is done
+        """
+        row = self.__conn.execute(
+            "SELECT last_deleted_id, done FROM scan_progress "
+            "WHERE entity_id = ? AND scan = ?",
+            (entity_id, scan),
+        ).fetchone()
+        return (row[0], bool(row[1])) if row else (0, False)
+
+    def save_scanned(self, entity_id: int, scan: str, batch: list[int]) -> None:
+        """
+        Records the lowest and the highest message IDs put into the delete stream
+        """
+        self.__upsert(entity_id, scan, "last_scanned_id", min(batch))
+        with self.__conn:
+            self.__conn.execute(
+                "UPDATE scan_progress SET top_id = MAX(top_id, ?) "
+                "WHERE entity_id = ? AND scan = ?",
+                (max(batch), entity_id, scan),
+            )
+
+    def save_deleted(self, entity_id: int, scan: str, message_id: int) -> None:
+        """
+        Records the lowest message ID of the last deleted batch
+        """
+        self.__upsert(entity_id, scan, "last_deleted_id", message_id)
+
+    def mark_scan_done(
+        self, entity_id: int, scan: str, high_water_mark: bool = True
+    ) -> None:
+        """
+        Marks the scan as done and all its messages as deleted,
+        raising the high-water mark to the highest message ID of the scan
+        and its shards ("scan@low-high") unless `high_water_mark` is False
+        """
+        self.__upsert(entity_id, scan, "done", 1)
+        if not high_water_mark:
+            return
+        with self.__conn:
+            self.__conn.execute(
+                "INSERT INTO high_water_marks "
+                "SELECT entity_id, ?, MAX(top_id) FROM scan_progress "
+                "WHERE entity_id = ? AND (scan = ? OR substr(scan, 1, ?) = ?) "
+                "GROUP BY entity_id HAVING MAX(top_id) > 0 "
+                "ON CONFLICT (entity_id, scan) "
+                "DO UPDATE SET max_id = MAX(max_id, excluded.max_id)",
+                (scan, entity_id, scan, len(scan) + 1, f"{scan}@"),
+            )
+
+    def high_water_mark(self, entity_id: int, scan: str) -> int:
+        """
+        Returns the highest message ID dealt with by a completed scan (0 if none)
+        """
+        row = self.__conn.execute(
+            "SELECT max_id FROM high_water_marks WHERE entity_id = ? AND scan = ?",
+            (entity_id, scan),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def load_dialogs(self, ttl: float, limit: int | None) -> list[bytes] | None:
+        """
+        Returns serialized entities of the dialog snapshot, or None if the snapshot
+        is older than `ttl` seconds or holds fewer dialogs than `limit` requires
+        """
+        fetched_at = self.__get_meta("dialogs_fetched_at")
+        if fetched_at is None or time.time() - fetched_at > ttl:
+            return None
+        cached_limit = self.__get_meta("dialogs_limit")
+        if cached_limit is not None and (limit is None or limit > cached_limit):
+            return None
+        rows = self.__conn.execute(
+            "SELECT entity FROM dialogs ORDER BY position LIMIT ?",
+            (-1 if limit is None else limit,),
+        )
+        return [entity for (entity,) in rows]
+
+    def save_dialogs(self, entities: list[bytes], limit: int | None) -> None:
+        """
+        Replaces the dialog snapshot with serialized entities fetched with `limit`
+        """
+        with self.__conn:
+            self.__conn.execute("DELETE FROM dialogs")
+            self.__conn.executemany(
+                "INSERT INTO dialogs VALUES (?, ?)", enumerate(entities)
+            )
+            self.__conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [("dialogs_fetched_at", time.time()), ("dialogs_limit", limit)],
+            )
+
+    def dialogs_age(self) -> float | None:
+        """
+        Returns the age of the dialog snapshot in seconds
+        """
+        fetched_at = self.__get_meta("dialogs_fetched_at")
+        return None if fetched_at is None else time.time() - fetched_at
+
+    def load_peers(self, peers: list[str], ttl: int) -> dict[str, tuple[int, int]]:
+        """
+        Returns (marked peer ID, access hash) of the peers resolved by previous
+        runs at most `ttl` seconds ago
+        """
+        placeholders = ",".join("?" * len(peers))
+        rows = self.__conn.execute(
+            "SELECT peer, peer_id, access_hash FROM peer_hashes "
+            f"WHERE peer IN ({placeholders}) AND resolved_at >= ?",
+            [*peers, time.time() - ttl],
+        )
+        return {peer: (peer_id, access_hash) for peer, peer_id, access_hash in rows}
+
+    def save_peers(self, peers: dict[str, tuple[int, int]]) -> None:
+        """
+        Stores (marked peer ID, access hash) of resolved peers
+        """
+        now = time.time()
+        with self.__conn:
+            self.__conn.executemany(
+                "INSERT OR REPLACE INTO peer_hashes VALUES (?, ?, ?, ?)",
+                [(peer, *ids, now) for peer, ids in peers.items()],
+            )
+
+    def index_messages(self, messages: list[tuple[int, int, int]]) -> None:
+        """
+        Adds own messages to the index as (entity ID, message ID, unix date)
+        """
+        with self.__conn:
+            self.__conn.executemany(
+                "INSERT OR IGNORE INTO own_messages VALUES (?, ?, ?)", messages
+            )
+
+    def due_messages(self, before: float, limit: int) -> list[tuple[int, int]]:
+        """
+        Returns up to `limit` indexed messages sent before the unix date
+        as (entity ID, message ID), grouped by entity
+        """
+        rows = self.__conn.execute(
+            "SELECT entity_id, message_id FROM own_messages WHERE date < ? "
+            "ORDER BY entity_id, message_id LIMIT ?",
+            (before, limit),
+        )
+        return rows.fetchall()
+
+    def forget_messages(self, entity_id: int, message_ids: list[int]) -> None:
+        """
+        Removes messages of an entity from the index
+        """
+        with self.__conn:
+            self.__conn.executemany(
+                "DELETE FROM own_messages WHERE entity_id = ? AND message_id = ?",
+                ((entity_id, message_id) for message_id in message_ids),
+            )
+
+    def index_started_at(self) -> float | None:
+        """
+        Returns when the daemon built the index with its first scan
+        """
+        return self.__get_meta("index_started_at")
+
+    def mark_index_started(self) -> None:
+        """
+        Records that the first scan of the daemon is complete
+        """
+        with self.__conn:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                ("index_started_at", time.time()),
+            )
+
+    def __get_meta(self, key: str) -> Any:
+        row = self.__conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def __upsert(self, entity_id: int, scan: str, column: str, value: int) -> None:
+        with self.__conn:
+            self.__conn.execute(
+                "INSERT INTO scan_progress (entity_id, scan) VALUES (?, ?) "
+                "ON CONFLICT (entity_id, scan) DO NOTHING",
+                (entity_id, scan),
+            )
+            self.__conn.execute(
+                f"UPDATE scan_progress SET {column} = ? "
+                "WHERE entity_id = ? AND scan = ?",
+                (value, entity_id, scan),
+            )
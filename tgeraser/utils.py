@@ -2,7 +2,8 @@ import asyncio
 import json
 import os
 import sys
-from typing import Any, Dict, Union
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Dict, List, Union
 
 from .exceptions import TgEraserException
 
@@ -21,6 +22,17 @@ async def async_input(prompt: str) -> str:
         raise TgEraserException(f"Error in async_input: {e}")
 
 
+async def gather_or_cancel(*aws: Awaitable[Any]) -> List[Any]:
+    """Run awaitables concurrently, cancelling the rest if one of them fails"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
 def sprint(string: str, *args: Any, **kwargs: Any) -> None:
     """Safe Print"""
     try:
@@ -39,6 +51,40 @@ def print_header(title: str) -> None:
     sprint(f"=={'=' * len(title)}==")
 
 
+class EntityOutput:
+    """
+    Output of a single entity. When buffered, lines are kept until flush()
+    so that concurrently processed entities don't interleave on the console.
+    Headers are prefixed with the label (session name) if given.
+    """
+
+    def __init__(self, buffered: bool = False, label: str = "") -> None:
+        self.__buffered = buffered
+        self.__label = label
+        self.__lines: list[str] = []
+
+    def print(self, string: str = "") -> None:
+        """Print a line or keep it until flush()"""
+        if self.__buffered:
+            self.__lines.append(string)
+        else:
+            sprint(string)
+
+    def header(self, title: str) -> None:
+        """Print a title like print_header()"""
+        if self.__label:
+            title = f"[{self.__label}] {title}"
+        self.print(f"\n=={'=' * len(title)}==")
+        self.print(f"= {title} =")
+        self.print(f"=={'=' * len(title)}==")
+
+    def flush(self) -> None:
+        """Print kept lines"""
+        for line in self.__lines:
+            sprint(line)
+        self.__lines.clear()
+
+
 def cast_to_int(num: str, name: str) -> int:
     """Check if a string represents an int"""
     try:
@@ -78,10 +124,11 @@ async def get_credentials(args: Dict[str, Any]) -> Dict[str, Union[str, int]]:
                     json.dump(creds, file)
                 sprint(f"Credentials saved to '{path_to_creds_file}' file.")
 
-        creds["session_name"] = os.path.join(
-            path_to_creds_dir,
-            args["<session_name>"] or await choose_session(path_to_creds_dir),
-        )
+        if not (args.get("--all-sessions") or args.get("--sessions")):
+            creds["session_name"] = os.path.join(
+                path_to_creds_dir,
+                args["<session_name>"] or await choose_session(path_to_creds_dir),
+            )
     except FileNotFoundError as err:
         raise TgEraserException(f"Error: {err}") from err
     except Exception as e:
@@ -115,9 +162,33 @@ def list_sessions(directory: str) -> list[str]:
     ]
 
 
+def get_session_paths(args: Dict[str, Any]) -> list[str]:
+    """
+    Return paths of sessions selected by --all-sessions or --sessions
+    """
+    directory = os.path.abspath(os.path.expanduser(args["--directory"]))
+    available = list_sessions(directory) if os.path.isdir(directory) else []
+
+    if args["--all-sessions"]:
+        names = sorted(available)
+    else:
+        names = [name.strip() for name in args["--sessions"].split(",") if name.strip()]
+        missing = [name for name in names if name not in available]
+        if missing:
+            raise TgEraserException(
+                f"Error: sessions not found in '{directory}': {', '.join(missing)}"
+            )
+
+    if not names:
+        raise TgEraserException(f"Error: no sessions found in '{directory}'.")
+    return [os.path.join(directory, name) for name in names]
+
+
 def parse_time_period(time_period: str, option_name: str) -> Dict[str, str | int]:
     """
-    Parse time period
+    Parse time period: either "N*unit" or an absolute ISO date like "2024-01-31"
+    or "2024-01-31T18:00" (local time unless an offset is given), which is
+    turned into the number of seconds passed since then
     """
     periods = {
         "seconds": 1,
@@ -126,8 +197,17 @@ def parse_time_period(time_period: str, option_name: str) -> Dict[str, str | int
         "days": 86400,
         "weeks": 604800,
     }
-    period = time_period.split("*")
-    if period[1] not in periods:
+    period = time_period.strip().split("*")
+    if len(period) == 1:
+        try:
+            date = datetime.fromisoformat(period[0])
+        except ValueError as err:
+            raise TgEraserException(f"'{option_name}' is specified incorrectly.") from err
+        if date.tzinfo is None:
+            date = date.astimezone()
+        seconds = (datetime.now(timezone.utc) - date).total_seconds()
+        return {"time": max(int(seconds), 0), "unit": "date", "value": period[0]}
+    if len(period) != 2 or period[1] not in periods or not period[0].isdigit():
         raise TgEraserException(f"'{option_name}' is specified incorrectly.")
     return {
         "time": int(period[0]) * periods[period[1]],